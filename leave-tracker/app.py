@@ -3,33 +3,44 @@ Leave Tracker Web Application
 Main Flask application with routes and business logic
 """
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, abort, current_app, g, has_request_context, render_template, request, jsonify, redirect, url_for, session, flash, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import bindparam, event, insert, literal_column, select, text, union_all, update, inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import contains_eager, joinedload
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
 from functools import wraps
+import bisect
+import email_service
+import hashlib
+import import_parsers
+import json
+import logging
 import os
+import secrets
+import threading
+import time
+import weakref
+import zlib
 from werkzeug.security import generate_password_hash, check_password_hash
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
-import os
+db = SQLAlchemy()
 
-# Use PostgreSQL on Render, SQLite locally
-database_url = os.environ.get('DATABASE_URL')
+# Routes are collected here and registered on each app by create_app()
+_routes = []
 
-if database_url:
-    # Fix Render's postgres:// to postgresql://
-    if database_url.startswith('postgres://'):
-        database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    print("==> Using PostgreSQL database")
-else:
-    # Local development
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///leaves.db'
-    print("==> Using SQLite database")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+def route(rule, **options):
+    """Like app.route, but deferred until create_app() builds the app"""
+    def decorator(f):
+        _routes.append((rule, f, options))
+        return f
+    return decorator
+
 
 # ============================================================================
 # DATABASE MODELS
@@ -42,13 +53,15 @@ class TeamMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
-    stream = db.Column(db.String(50), nullable=False)
-    location = db.Column(db.String(20), nullable=False)  # UAE, India
+    stream = db.Column(db.String(50), nullable=False, index=True)
+    location = db.Column(db.String(20), nullable=False, index=True)  # UAE, India
     role = db.Column(db.String(20), default='member')  # member, scrum_master
     annual_entitlement = db.Column(db.Integer, default=22)
     sick_entitlement = db.Column(db.Integer, default=10)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Signed into the member's calendar feed URLs; replacing it revokes them
+    feed_secret = db.Column(db.String(32), default=lambda: secrets.token_urlsafe(12))
     
     # Relationships
     leave_requests = db.relationship('LeaveRequest', 
@@ -63,25 +76,23 @@ class TeamMember(db.Model):
     def __repr__(self):
         return f'<TeamMember {self.name} - {self.stream}>'
     
-    def get_balance(self, leave_type):
-        """Calculate remaining leave balance"""
+    def get_entitlement(self, leave_type):
+        """Yearly entitlement for a leave type"""
         if leave_type == 'Annual':
-            entitlement = self.annual_entitlement
-        else:
-            entitlement = self.sick_entitlement
-        
-        # Sum approved leaves of this type
-        approved_leaves = LeaveRequest.query.filter_by(
-            employee_id=self.id,
-            leave_type=leave_type,
-            status='Approved'
-        ).all()
-        
-        used_days = sum(leave.working_days for leave in approved_leaves)
-        return entitlement - used_days
-    
-    def to_dict(self):
-        """Convert to dictionary for JSON responses"""
+            return self.annual_entitlement
+        return self.sick_entitlement
+    
+    def get_balance(self, leave_type, leave_year=None):
+        """Remaining leave balance for a leave year (current by default) from the balance ledger"""
+        return get_balances([self], [leave_type], leave_year)[(self.id, leave_type)]
+    
+    def to_dict(self, balances=None):
+        """
+        Convert to dictionary for JSON responses
+        Pass balances from get_balances() to avoid per-member balance queries
+        """
+        if balances is None:
+            balances = get_balances([self])
         return {
             'id': self.id,
             'name': self.name,
@@ -89,14 +100,19 @@ class TeamMember(db.Model):
             'stream': self.stream,
             'location': self.location,
             'role': self.role,
-            'annual_balance': self.get_balance('Annual'),
-            'sick_balance': self.get_balance('Sick')
+            'annual_balance': balances[(self.id, 'Annual')],
+            'sick_balance': balances[(self.id, 'Sick')]
         }
 
 
 class Holiday(db.Model):
     """Public holidays by location"""
     __tablename__ = 'holidays'
+    __table_args__ = (
+        db.Index('ix_holidays_location_date', 'location', 'date'),
+        # One holiday per day and location; imports upsert on this key
+        db.UniqueConstraint('date', 'location', name='uq_holiday_date_location'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -120,6 +136,15 @@ class Holiday(db.Model):
 class LeaveRequest(db.Model):
     """Leave requests from team members"""
     __tablename__ = 'leave_requests'
+    __table_args__ = (
+        # Keyset pagination of the team leaves listing
+        db.Index('ix_leave_requests_submitted_at_id', 'submitted_at', 'id'),
+        db.Index('ix_leave_requests_status_submitted_at', 'status', 'submitted_at'),
+        # Calendar windows and overlap checks over approved leaves
+        db.Index('ix_leave_requests_status_dates', 'status', 'start_date', 'end_date'),
+        # Per-member balance and history lookups
+        db.Index('ix_leave_requests_employee_type_status', 'employee_id', 'leave_type', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
@@ -140,7 +165,13 @@ class LeaveRequest(db.Model):
     def __repr__(self):
         return f'<LeaveRequest {self.id} - {self.employee.name} - {self.status}>'
     
+    @classmethod
+    def with_employee(cls):
+        """Query with the employee joined in, for listings that render employee fields"""
+        return cls.query.options(joinedload(cls.employee))
+    
     def to_dict(self):
+        """Convert to dictionary (load via with_employee() to avoid a query per row)"""
         return {
             'id': self.id,
             'employee_name': self.employee.name,
@@ -158,6 +189,89 @@ class LeaveRequest(db.Model):
         }
 
 
+class LeaveBalance(db.Model):
+    """Materialized approved-leave usage per member, leave type and leave year"""
+    __tablename__ = 'leave_balances'
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'leave_type', 'leave_year', name='uq_leave_balance'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    leave_type = db.Column(db.String(20), nullable=False)  # Annual, Sick
+    leave_year = db.Column(db.Integer, nullable=False)
+    used_days = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LeaveBalance {self.employee_id} - {self.leave_type} {self.leave_year}: {self.used_days}>'
+
+
+class LeaveYearSnapshot(db.Model):
+    """Closing balance of a leave year per member and leave type, written by the year-end rollover"""
+    __tablename__ = 'leave_year_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'leave_type', 'leave_year', name='uq_leave_year_snapshot'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    leave_type = db.Column(db.String(20), nullable=False)  # Annual, Sick
+    leave_year = db.Column(db.Integer, nullable=False)
+    entitlement = db.Column(db.Float, nullable=False)
+    carried_in = db.Column(db.Float, nullable=False, default=0)
+    used_days = db.Column(db.Float, nullable=False, default=0)
+    closing_balance = db.Column(db.Float, nullable=False)
+    carried_forward = db.Column(db.Float, nullable=False, default=0)  # Into leave_year + 1
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LeaveYearSnapshot {self.employee_id} - {self.leave_type} {self.leave_year}: {self.closing_balance}>'
+
+
+class LeaveDay(db.Model):
+    """Materialized approved leave: one row per member per calendar day off"""
+    __tablename__ = 'leave_days'
+    __table_args__ = (
+        # "Who is out on D / between D1 and D2" is a range scan of this index
+        db.UniqueConstraint('date', 'employee_id', 'leave_id', name='uq_leave_day'),
+        db.Index('ix_leave_days_leave_id', 'leave_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    leave_id = db.Column(db.Integer, db.ForeignKey('leave_requests.id'), nullable=False)
+    leave_type = db.Column(db.String(20), nullable=False)
+    day_type = db.Column(db.String(20), default='Full Day')
+    
+    def __repr__(self):
+        return f'<LeaveDay {self.date} - {self.employee_id} ({self.leave_type})>'
+
+
+class EmailOutbox(db.Model):
+    """Notification emails queued in the same transaction as the change they report"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.Text, nullable=False)  # Comma separated
+    subject = db.Column(db.String(300), nullable=False)
+    body_html = db.Column(db.Text, nullable=False)
+    digest = db.Column(db.Boolean, default=False)  # Held for the recipient's next digest
+    status = db.Column(db.String(20), default='Pending')  # Pending, Sent, Failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} - {self.subject} - {self.status}>'
+
+
 class Configuration(db.Model):
     """System configuration settings"""
     __tablename__ = 'configuration'
@@ -195,89 +309,1468 @@ class Sprint(db.Model):
 
 
 # ============================================================================
-# HELPER FUNCTIONS
+# CHANGE TRACKING
 # ============================================================================
 
-def calculate_working_days(start_date, end_date, location):
+# Tables whose committed changes invalidate in-process caches
+_data_versions = {'holidays': 0, 'leave_requests': 0, 'configuration': 0, 'team_members': 0, 'sprints': 0}
+_change_listeners = []
+
+
+def on_data_change(f):
     """
-    Calculate working days between two dates
-    Excludes weekends (Sat-Sun) and location-specific holidays
+    Register f(changed_tables, changed_leaves) to run after a commit touching tracked tables
+    changed_leaves lists (employee_id, start_date, end_date) for every leave
+    request written (old and new dates), or is None after a bulk statement
+    """
+    _change_listeners.append(f)
+    return f
+
+
+def _mark_changed(session, table_name):
+    if table_name in _data_versions:
+        session.info.setdefault('changed_tables', set()).add(table_name)
+
+
+def _mark_leave_changed(session, leave):
+    changed_leaves = session.info.setdefault('changed_leaves', [])
+    if changed_leaves is None:
+        return
+    state = sa_inspect(leave)
+    starts = set(state.attrs.start_date.history.deleted) | {leave.start_date}
+    ends = set(state.attrs.end_date.history.deleted) | {leave.end_date}
+    for employee_id in set(state.attrs.employee_id.history.deleted) | {leave.employee_id}:
+        changed_leaves.append((employee_id, min(starts), max(ends)))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flushed_changes(session, flush_context):
+    """Record which tracked tables (and which leaves) were written in this transaction"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            _mark_changed(session, table)
+        if isinstance(obj, LeaveRequest):
+            _mark_leave_changed(session, obj)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_bulk_changes(orm_execute_state):
+    """Record bulk insert / update / delete statements"""
+    is_bulk = orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+    if is_bulk and orm_execute_state.bind_mapper:
+        table = orm_execute_state.bind_mapper.local_table.name
+        _mark_changed(orm_execute_state.session, table)
+        if table == 'leave_requests':
+            # Rows unknown - listeners must treat every leave as changed
+            orm_execute_state.session.info['changed_leaves'] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_changes(session):
+    """Bump data versions and notify cache listeners once the commit is durable"""
+    changed = session.info.pop('changed_tables', None)
+    changed_leaves = session.info.pop('changed_leaves', [])
+    if not changed:
+        return
+    for table in changed:
+        _data_versions[table] += 1
+    for listener in _change_listeners:
+        listener(changed, changed_leaves)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changed_tables', None)
+    session.info.pop('changed_leaves', None)
+
+
+class VersionedCache:
+    """
+    Small thread-safe LRU cache for derived data
+    Each entry remembers the versions of the tables it was built from and is
+    discarded once any of them changes. The TTL bounds staleness from writes
+    committed by other worker processes, which don't bump this process's versions.
+    """
+    
+    def __init__(self, tables, max_entries=256, ttl=60):
+        self.tables = tuple(tables)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def version(self):
+        return tuple(_data_versions[table] for table in self.tables)
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            version, created, value = entry
+            if version != self.version() or time.monotonic() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def get_or_build(self, key, build):
+        """Return the cached value for key, calling build() on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        
+        version = self.version()
+        value = build()
+        with self._lock:
+            # Don't cache a value built from data that changed mid-build
+            if version == self.version():
+                self._entries[key] = (version, time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ============================================================================
+# WORKING DAY CALENDAR INDEX
+# ============================================================================
+
+# Default weekend (Saturday=5, Sunday=6); override per location with a
+# Configuration row such as key='weekend_days_UAE', value='5,6'
+DEFAULT_WEEKEND_DAYS = (5, 6)
+
+# (location, year) -> (built_at, WorkingDayCalendar). Commits in this process
+# invalidate immediately; the TTL bounds lag behind other worker processes
+CALENDAR_INDEX_TTL = 60
+_calendar_index = {}
+_calendar_index_lock = threading.Lock()
+
+
+class WorkingDayCalendar:
+    """
+    Working days of one location for one calendar year
+    Stored as a bitset (bit i = day i of the year is a working day) plus
+    prefix sums, so counting any range inside the year is O(1)
     """
-    if start_date > end_date:
-        return 0
     
-    working_days = 0
-    current_date = start_date
+    def __init__(self, location, year, weekend_days, holiday_dates):
+        self.location = location
+        self.year = year
+        self.first_day = date(year, 1, 1)
+        self.last_day = date(year, 12, 31)
+        
+        bits = 0
+        prefix = [0]
+        for offset in range((self.last_day - self.first_day).days + 1):
+            day = self.first_day + timedelta(days=offset)
+            is_working = day.weekday() not in weekend_days and day not in holiday_dates
+            if is_working:
+                bits |= 1 << offset
+            prefix.append(prefix[-1] + is_working)
+        
+        self.bits = bits
+        self.prefix = prefix
+    
+    def is_working_day(self, day):
+        return bool(self.bits >> (day - self.first_day).days & 1)
     
-    # Get holidays for this location
+    def count(self, start_date, end_date):
+        """Count working days in [start_date, end_date], both inside this year"""
+        if start_date > end_date:
+            return 0
+        start = (start_date - self.first_day).days
+        end = (end_date - self.first_day).days
+        return self.prefix[end + 1] - self.prefix[start]
+
+
+def get_weekend_days(location):
+    """Weekday numbers treated as weekend for a location"""
+    config = Configuration.query.filter_by(key=f'weekend_days_{location}').first()
+    if not config or not config.value.strip():
+        return DEFAULT_WEEKEND_DAYS
+    return tuple(int(day) for day in config.value.split(','))
+
+
+def get_indexed_calendar(key):
+    """Cached WorkingDayCalendar for (location, year), or None if missing or expired"""
+    entry = _calendar_index.get(key)
+    if entry is None or time.monotonic() - entry[0] > CALENDAR_INDEX_TTL:
+        return None
+    return entry[1]
+
+
+def get_working_day_calendar(location, year):
+    """Return the cached WorkingDayCalendar for a location and year, building it on first use"""
+    calendar = get_indexed_calendar((location, year))
+    if calendar is None:
+        calendar = load_working_day_calendars([(location, year)])[(location, year)]
+    return calendar
+
+
+def load_working_day_calendars(keys, fresh=False):
+    """
+    Return {(location, year): WorkingDayCalendar} for all requested keys
+    Calendars missing from the index are built from a single Holiday query.
+    fresh=True builds every calendar from the database (for values that get
+    persisted, which must not depend on another worker's stale index)
+    """
+    keys = set(keys)
+    calendars = {}
+    if not fresh:
+        for key in keys:
+            calendar = get_indexed_calendar(key)
+            if calendar is not None:
+                calendars[key] = calendar
+    missing = keys - set(calendars)
+    if not missing:
+        return calendars
+    
+    version = (_data_versions['holidays'], _data_versions['configuration'])
+    locations = set(location for location, _ in missing)
+    years = set(year for _, year in missing)
     holidays = Holiday.query.filter(
-        (Holiday.location == location) | (Holiday.location == 'Both')
+        Holiday.location.in_(locations | {'Both'}),
+        Holiday.date >= date(min(years), 1, 1),
+        Holiday.date <= date(max(years), 12, 31)
     ).all()
-    holiday_dates = set(h.date for h in holidays)
     
-    while current_date <= end_date:
-        # Skip weekends (Saturday=5, Sunday=6)
-        if current_date.weekday() not in [5, 6]:
-            # Skip holidays
-            if current_date not in holiday_dates:
-                working_days += 1
-        current_date += timedelta(days=1)
+    built = {}
+    for location, year in missing:
+        holiday_dates = set(
+            h.date for h in holidays
+            if h.location in (location, 'Both') and h.date.year == year
+        )
+        built[(location, year)] = WorkingDayCalendar(location, year, get_weekend_days(location), holiday_dates)
     
-    return working_days
+    with _calendar_index_lock:
+        # Don't cache calendars built from data that changed mid-build
+        if version == (_data_versions['holidays'], _data_versions['configuration']):
+            built_at = time.monotonic()
+            _calendar_index.update((key, (built_at, calendar)) for key, calendar in built.items())
+    calendars.update(built)
+    return calendars
 
 
-def check_overlap(employee_id, start_date, end_date, exclude_request_id=None):
+@on_data_change
+def _invalidate_calendar_index(changed_tables, changed_leaves):
+    if 'holidays' in changed_tables or 'configuration' in changed_tables:
+        with _calendar_index_lock:
+            _calendar_index.clear()
+
+
+# ============================================================================
+# OVERLAP INDEX
+# ============================================================================
+
+# stream -> StreamLeaveIndex. Commits in this process invalidate the affected
+# streams immediately; the TTL bounds lag behind other worker processes
+OVERLAP_INDEX_TTL = 60
+_overlap_index = {}
+_overlap_index_lock = threading.Lock()
+
+
+class StreamLeaveIndex:
     """
-    Check if leave request overlaps with approved leaves from same stream
-    Returns (has_overlap, overlapping_employee_name, overlapping_dates)
+    Approved leaves of one stream as a static interval tree
+    Leaves are sorted by start date and the array is read as an implicit
+    balanced tree (each range's middle leave is its root). max_ends holds the
+    latest end date in each subtree, so a query skips every subtree that ends
+    before the range and runs in O(log n + k) for k overlapping leaves.
     """
-    employee = TeamMember.query.get(employee_id)
-    if not employee:
-        return False, None, None
     
-    # Get all approved leaves from same stream (excluding this employee)
-    query = db.session.query(LeaveRequest).join(
-        TeamMember,
-        LeaveRequest.employee_id == TeamMember.id
-    ).filter(
-        TeamMember.stream == employee.stream,
-        TeamMember.id != employee_id,
-        LeaveRequest.status == 'Approved',
-        LeaveRequest.start_date <= end_date,
-        LeaveRequest.end_date >= start_date
+    def __init__(self, stream, member_ids, leaves):
+        self.stream = stream
+        self.member_ids = set(member_ids)
+        self.built_at = time.monotonic()
+        # (start_date, end_date, leave_id, employee_id, employee_name)
+        self.leaves = sorted(leaves)
+        self.max_ends = [leave[1] for leave in self.leaves]
+        self._build_max_ends(0, len(self.leaves))
+    
+    def _build_max_ends(self, low, high):
+        if low >= high:
+            return None
+        mid = (low + high) // 2
+        for child_end in (self._build_max_ends(low, mid), self._build_max_ends(mid + 1, high)):
+            if child_end is not None and child_end > self.max_ends[mid]:
+                self.max_ends[mid] = child_end
+        return self.max_ends[mid]
+    
+    def overlapping(self, start_date, end_date):
+        """Leaves overlapping [start_date, end_date], in start date order"""
+        found = []
+        self._collect(0, len(self.leaves), start_date, end_date, found)
+        return found
+    
+    def _collect(self, low, high, start_date, end_date, found):
+        if low >= high:
+            return
+        mid = (low + high) // 2
+        if self.max_ends[mid] < start_date:
+            return  # Everything in this subtree ends before the range
+        self._collect(low, mid, start_date, end_date, found)
+        leave = self.leaves[mid]
+        if leave[0] > end_date:
+            return  # This leave and the right subtree start after the range
+        if leave[1] >= start_date:
+            found.append(leave)
+        self._collect(mid + 1, high, start_date, end_date, found)
+
+
+def get_stream_leave_index(stream):
+    """Return the cached StreamLeaveIndex for a stream, building it with one query on first use"""
+    index = _overlap_index.get(stream)
+    if index is not None and time.monotonic() - index.built_at <= OVERLAP_INDEX_TTL:
+        return index
+    
+    version = (_data_versions['leave_requests'], _data_versions['team_members'])
+    rows = db.session.query(
+        TeamMember.id, TeamMember.name, LeaveRequest.id,
+        LeaveRequest.start_date, LeaveRequest.end_date
+    ).outerjoin(
+        LeaveRequest,
+        (LeaveRequest.employee_id == TeamMember.id) & (LeaveRequest.status == 'Approved')
+    ).filter(TeamMember.stream == stream).all()
+    
+    index = StreamLeaveIndex(
+        stream,
+        [member_id for member_id, _, _, _, _ in rows],
+        [(start, end, leave_id, member_id, name)
+         for member_id, name, leave_id, start, end in rows if leave_id is not None]
     )
+    with _overlap_index_lock:
+        # Don't cache an index built from data that changed mid-build
+        if version == (_data_versions['leave_requests'], _data_versions['team_members']):
+            _overlap_index[stream] = index
+    return index
+
+
+@on_data_change
+def _sync_overlap_index(changed_tables, changed_leaves):
+    """Drop the indexes of streams whose members' leaves changed"""
+    with _overlap_index_lock:
+        if 'team_members' in changed_tables or changed_leaves is None:
+            _overlap_index.clear()
+            return
+        if 'leave_requests' not in changed_tables:
+            return
+        employee_ids = set(employee_id for employee_id, _, _ in changed_leaves)
+        for stream, index in list(_overlap_index.items()):
+            if index.member_ids & employee_ids:
+                del _overlap_index[stream]
+
+
+# ============================================================================
+# CONCURRENCY CONTROL
+# ============================================================================
+
+# Advisory lock namespaces (first key of PostgreSQL's two-key advisory locks)
+LOCK_MEMBER = 1
+LOCK_STREAM = 2
+
+# Fallback locks for other databases - only serialize this process
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def leave_lock_keys(employees):
+    """Sorted (namespace, key) pairs for the members and their streams"""
+    keys = set()
+    for employee in employees:
+        keys.add((LOCK_MEMBER, employee.id))
+        keys.add((LOCK_STREAM, zlib.crc32(employee.stream.encode()) & 0x7fffffff))
+    return sorted(keys)
+
+
+def lock_leave_writes(employees):
+    """
+    Serialize leave writes per member and per stream until the transaction ends
+    Balance and overlap checks made after this call see every committed write
+    for these members and streams, and nobody else can change them before we
+    commit. PostgreSQL uses transaction-scoped advisory locks shared by all
+    workers; other databases fall back to per-process locks. Keys are always
+    taken in sorted order, so callers can't deadlock each other, and requests
+    for unrelated members and streams never wait.
+    """
+    held = db.session.info.setdefault('leave_locks', set())
+    keys = [key for key in leave_lock_keys(employees) if key not in held]
+    if not keys:
+        return
+    
+    if db.session.get_bind().dialect.name == 'postgresql':
+        for namespace, key in keys:
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:namespace, :key)'),
+                               {'namespace': namespace, 'key': key})
+    else:
+        local = db.session.info.setdefault('local_leave_locks', [])
+        for key in keys:
+            with _local_locks_guard:
+                lock = _local_locks.setdefault(key, threading.Lock())
+            lock.acquire()
+            local.append(lock)
+    held.update(keys)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _release_leave_locks(session, transaction):
+    """Advisory locks end with the database transaction; release the local fallback ones too"""
+    if transaction.parent is not None:
+        return
+    session.info.pop('leave_locks', None)
+    for lock in session.info.pop('local_leave_locks', []):
+        lock.release()
+
+
+# ============================================================================
+# HELPER FUNCTIONS
+# ============================================================================
+
+def calculate_working_days(start_date, end_date, location, fresh=False):
+    """
+    Calculate working days between two dates
+    Excludes location weekends (default Sat-Sun) and location-specific holidays
+    """
+    return calculate_working_days_batch([(start_date, end_date, location)], fresh)[0]
+
+
+# Limits for the working-day APIs: every (location, year) a request touches is
+# a calendar to build, so both the number of ranges and the span are capped
+WORKING_DAYS_BATCH_MAX_RANGES = 200
+WORKING_DAYS_MAX_SPAN_DAYS = 3 * 366
+
+
+def check_working_day_span(ranges):
+    """Raise ValueError if ranges reach further apart than the API allows (before any calendar is built)"""
+    if ranges:
+        first = min(start for start, _, _ in ranges)
+        last = max(end for _, end, _ in ranges)
+        if (last - first).days >= WORKING_DAYS_MAX_SPAN_DAYS:
+            raise ValueError(f'Dates must fall within {WORKING_DAYS_MAX_SPAN_DAYS} days')
+
+
+def calculate_working_days_batch(ranges, fresh=False):
+    """
+    Calculate working days for many (start_date, end_date, location) tuples
+    Loads every calendar the batch needs up front, then counts each range
+    from prefix sums. Returns counts in the same order as ranges.
+    fresh=True bypasses the calendar index (see load_working_day_calendars)
+    """
+    keys = set()
+    for start_date, end_date, location in ranges:
+        for year in range(start_date.year, end_date.year + 1):
+            keys.add((location, year))
+    calendars = load_working_day_calendars(keys, fresh)
     
-    if exclude_request_id:
-        query = query.filter(LeaveRequest.id != exclude_request_id)
+    results = []
+    for start_date, end_date, location in ranges:
+        working_days = 0
+        for year in range(start_date.year, end_date.year + 1):
+            calendar = calendars[(location, year)]
+            working_days += calendar.count(max(start_date, calendar.first_day),
+                                           min(end_date, calendar.last_day))
+        results.append(working_days)
     
-    overlapping = query.first()
+    return results
+
+
+def find_overlaps(employee_id, start_date, end_date, exclude_request_id=None, fresh=False):
+    """
+    All approved leaves from the employee's stream (other members) overlapping the range
+    Returns a list of dicts with leave_id, employee_name, start_date and end_date.
+    fresh=True queries the database instead of the process-local index, which
+    can lag behind other workers - use it for checks made under lock_leave_writes()
+    """
+    employee = TeamMember.query.get(employee_id)
+    if not employee:
+        return []
+    
+    if fresh:
+        leaves = db.session.query(
+            LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.id,
+            TeamMember.id, TeamMember.name
+        ).join(TeamMember, LeaveRequest.employee_id == TeamMember.id).filter(
+            TeamMember.stream == employee.stream,
+            LeaveRequest.status == 'Approved',
+            LeaveRequest.start_date <= end_date,
+            LeaveRequest.end_date >= start_date
+        ).order_by(LeaveRequest.start_date, LeaveRequest.id).all()
+    else:
+        leaves = get_stream_leave_index(employee.stream).overlapping(start_date, end_date)
+    
+    return [
+        {'leave_id': leave_id, 'employee_name': name, 'start_date': start, 'end_date': end}
+        for start, end, leave_id, other_id, name in leaves
+        if other_id != employee_id and leave_id != exclude_request_id
+    ]
+
+
+def check_overlap(employee_id, start_date, end_date, exclude_request_id=None):
+    """
+    Check if leave request overlaps with approved leaves from same stream
+    Returns (has_overlap, overlapping_employee_name, overlapping_dates) for the
+    first conflict; use find_overlaps() for the full list
+    """
+    overlaps = find_overlaps(employee_id, start_date, end_date, exclude_request_id)
     
-    if overlapping:
-        return True, overlapping.employee.name, (overlapping.start_date, overlapping.end_date)
+    if overlaps:
+        first = overlaps[0]
+        return True, first['employee_name'], (first['start_date'], first['end_date'])
     
     return False, None, None
 
 
-def check_sufficient_balance(employee_id, leave_type, required_days):
+def check_sufficient_balance(employee_id, leave_type, required_days, leave_year=None):
     """
     Check if employee has sufficient balance for leave request
+    leave_year is the year the leave is booked against (current by default)
     Returns (sufficient, current_balance, remaining_balance)
     """
     employee = TeamMember.query.get(employee_id)
     if not employee:
         return False, 0, 0
     
-    current_balance = employee.get_balance(leave_type)
+    current_balance = employee.get_balance(leave_type, leave_year)
     remaining = current_balance - required_days
     
     return remaining >= 0, current_balance, remaining
 
 
+LEAVE_TYPES = ('Annual', 'Sick')
+
+# Share of a working day taken by each leave day type
+DAY_TYPE_FRACTIONS = {'Full Day': 1, 'Half Day': 0.5, 'Quarter Day': 0.25}
+
+
+# Leave year settings, from Configuration rows:
+#   leave_year_start       'MM-DD' each leave year starts on (default 01-01)
+#   carry_forward_<type>   most unused days carried into the next year
+DEFAULT_LEAVE_YEAR_START = (1, 1)
+DEFAULT_CARRY_FORWARD = {'Annual': 5, 'Sick': 0}
+
+_leave_year_settings_cache = VersionedCache(['configuration'], max_entries=1)
+
+
+def get_leave_year_settings():
+    """(start_month, start_day, {leave_type: carry_forward_cap}), cached until configuration changes"""
+    def build():
+        keys = ['leave_year_start'] + [f'carry_forward_{leave_type}' for leave_type in LEAVE_TYPES]
+        values = dict(db.session.query(Configuration.key, Configuration.value).filter(Configuration.key.in_(keys)))
+        
+        start_month, start_day = DEFAULT_LEAVE_YEAR_START
+        if (values.get('leave_year_start') or '').strip():
+            start_month, start_day = (int(part) for part in values['leave_year_start'].split('-'))
+            date(2001, start_month, start_day)  # Reject impossible starts such as 02-30 (or 02-29)
+        caps = {
+            leave_type: float(values.get(f'carry_forward_{leave_type}') or DEFAULT_CARRY_FORWARD[leave_type])
+            for leave_type in LEAVE_TYPES
+        }
+        return start_month, start_day, caps
+    
+    return _leave_year_settings_cache.get_or_build('settings', build)
+
+
+def get_leave_year(day):
+    """Leave year a date belongs to, named after the calendar year it starts in"""
+    start_month, start_day, _ = get_leave_year_settings()
+    return day.year if (day.month, day.day) >= (start_month, start_day) else day.year - 1
+
+
+def get_leave_year_bounds(leave_year):
+    """(first_day, last_day) of a leave year"""
+    start_month, start_day, _ = get_leave_year_settings()
+    first_day = date(leave_year, start_month, start_day)
+    return first_day, date(leave_year + 1, start_month, start_day) - timedelta(days=1)
+
+
+# Ledger rows of a leave year and the one before it, plus the rollover snapshots
+# of the two years before it (is_snapshot=1); built once since balances are
+# read on most requests
+_balance_rows = union_all(
+    select(
+        LeaveBalance.employee_id, LeaveBalance.leave_type, LeaveBalance.leave_year,
+        LeaveBalance.used_days.label('days'), literal_column('0').label('is_snapshot')
+    ).where(
+        LeaveBalance.employee_id.in_(bindparam('member_ids', expanding=True)),
+        LeaveBalance.leave_type.in_(bindparam('leave_types', expanding=True)),
+        LeaveBalance.leave_year.in_(bindparam('ledger_years', expanding=True))
+    ),
+    select(
+        LeaveYearSnapshot.employee_id, LeaveYearSnapshot.leave_type, LeaveYearSnapshot.leave_year,
+        LeaveYearSnapshot.carried_forward, literal_column('1')
+    ).where(
+        LeaveYearSnapshot.employee_id.in_(bindparam('member_ids', expanding=True)),
+        LeaveYearSnapshot.leave_type.in_(bindparam('leave_types', expanding=True)),
+        LeaveYearSnapshot.leave_year.in_(bindparam('snapshot_years', expanding=True))
+    )
+)
+
+
+def load_balance_rows(members, leave_types, leave_year):
+    """
+    ({(member_id, leave_type, year): used_days}, {(member_id, leave_type, year): carried_forward})
+    for the ledger of leave_year and leave_year - 1 and the snapshots of the two years before
+    """
+    used, carried = {}, {}
+    if members:
+        rows = db.session.execute(_balance_rows, {
+            'member_ids': list(set(m.id for m in members)),
+            'leave_types': list(leave_types),
+            'ledger_years': [leave_year, leave_year - 1],
+            'snapshot_years': [leave_year - 1, leave_year - 2],
+        })
+        for employee_id, leave_type, row_year, days, is_snapshot in rows:
+            (carried if is_snapshot else used)[(employee_id, leave_type, row_year)] = days
+    return used, carried
+
+
+def compute_carry_forward(member, leave_type, leave_year, carried_in, used_days, caps):
+    """
+    (closing_balance, carried_forward) of a leave year, as the rollover snapshots it
+    Members who joined after the year ended carry nothing from it
+    """
+    closing = member.get_entitlement(leave_type) + carried_in - used_days
+    _, last_day = get_leave_year_bounds(leave_year)
+    if member.created_at and member.created_at.date() > last_day:
+        return closing, 0
+    return closing, max(0, min(closing, caps[leave_type]))
+
+
+def get_carried_in(member, leave_type, leave_year, used, carried, caps):
+    """
+    Days carried into leave_year: the previous year's snapshot, or - while that
+    year hasn't been rolled over yet (year start, failed rollover, next-year
+    bookings) - its carry-forward worked out the way the rollover would
+    """
+    key = (member.id, leave_type, leave_year - 1)
+    if key in carried:
+        return carried[key]
+    _, carry = compute_carry_forward(
+        member, leave_type, leave_year - 1,
+        carried.get((member.id, leave_type, leave_year - 2), 0), used.get(key, 0), caps
+    )
+    return carry
+
+
+def get_balances(members, leave_types=LEAVE_TYPES, leave_year=None):
+    """
+    Calculate remaining balances for many members in one query
+    Balance = entitlement + days carried in from the previous year - days used
+    in the leave year (the current one by default). Only two years of ledger
+    rows and rollover snapshots are read, however long the history.
+    Returns {(member_id, leave_type): balance} for every member and leave type
+    """
+    members = list(members)
+    if leave_year is None:
+        leave_year = get_leave_year(date.today())
+    _, _, caps = get_leave_year_settings()
+    used, carried = load_balance_rows(members, leave_types, leave_year)
+    
+    return {
+        (member.id, leave_type): (member.get_entitlement(leave_type)
+                                  + get_carried_in(member, leave_type, leave_year, used, carried, caps)
+                                  - used.get((member.id, leave_type, leave_year), 0))
+        for member in members
+        for leave_type in leave_types
+    }
+
+
+def rollover_leave_year(leave_year):
+    """
+    Snapshot every member's closing balances for a leave year (caller commits)
+    closing = entitlement + carried in - used; the next year starts with the
+    closing balance capped at the leave type's carry-forward cap (never below 0).
+    Re-running recomputes the snapshots, e.g. after a late approval.
+    Returns the snapshots written.
+    """
+    _, _, caps = get_leave_year_settings()
+    members = TeamMember.query.all()
+    used, carried = load_balance_rows(members, LEAVE_TYPES, leave_year)
+    existing = {
+        (snapshot.employee_id, snapshot.leave_type): snapshot
+        for snapshot in LeaveYearSnapshot.query.filter_by(leave_year=leave_year)
+    }
+    
+    snapshots = []
+    for member in members:
+        for leave_type in LEAVE_TYPES:
+            carried_in = get_carried_in(member, leave_type, leave_year, used, carried, caps)
+            used_days = used.get((member.id, leave_type, leave_year), 0)
+            closing, carried_forward = compute_carry_forward(member, leave_type, leave_year,
+                                                             carried_in, used_days, caps)
+            snapshot = existing.get((member.id, leave_type))
+            if snapshot is None:
+                snapshot = LeaveYearSnapshot(employee_id=member.id, leave_type=leave_type, leave_year=leave_year)
+                db.session.add(snapshot)
+            snapshot.entitlement = member.get_entitlement(leave_type)
+            snapshot.carried_in = carried_in
+            snapshot.used_days = used_days
+            snapshot.closing_balance = closing
+            snapshot.carried_forward = carried_forward
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def update_balance_ledger(leave_req, old_status, new_status):
+    """
+    Apply a leave status transition to the balance ledger
+    Only transitions into or out of 'Approved' change used days. Runs in the
+    caller's transaction; the caller commits together with the leave change.
+    """
+    was_approved = old_status == 'Approved'
+    is_approved = new_status == 'Approved'
+    if was_approved == is_approved:
+        return
+    
+    delta = leave_req.working_days if is_approved else -leave_req.working_days
+    key = dict(
+        employee_id=leave_req.employee_id,
+        leave_type=leave_req.leave_type,
+        leave_year=get_leave_year(leave_req.start_date)
+    )
+    
+    # Atomic upsert: concurrent approvals neither lose updates nor race to
+    # insert the first row of a (member, type, year)
+    dialect_insert = postgresql_insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    statement = dialect_insert(LeaveBalance).values(used_days=delta, **key)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['employee_id', 'leave_type', 'leave_year'],
+        set_={'used_days': LeaveBalance.used_days + statement.excluded.used_days,
+              'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def rebuild_balance_ledger(fix=True):
+    """
+    Recompute the balance ledger from approved leave history
+    Returns a list of (employee_id, leave_type, leave_year, ledger_days, actual_days)
+    for every entry that drifted. With fix=True the ledger is corrected and committed.
+    """
+    actual = {}
+    approved = db.session.query(
+        LeaveRequest.employee_id, LeaveRequest.leave_type,
+        LeaveRequest.start_date, LeaveRequest.working_days
+    ).filter(LeaveRequest.status == 'Approved')
+    for employee_id, leave_type, start_date, working_days in approved:
+        key = (employee_id, leave_type, get_leave_year(start_date))
+        actual[key] = actual.get(key, 0) + working_days
+    
+    entries = {
+        (e.employee_id, e.leave_type, e.leave_year): e
+        for e in LeaveBalance.query.all()
+    }
+    
+    drift = []
+    for key in sorted(set(actual) | set(entries), key=str):
+        entry = entries.get(key)
+        ledger_days = entry.used_days if entry else 0
+        actual_days = actual.get(key, 0)
+        if abs(ledger_days - actual_days) < 1e-9:
+            continue
+        drift.append(key + (ledger_days, actual_days))
+        if fix:
+            if entry:
+                entry.used_days = actual_days
+            else:
+                employee_id, leave_type, leave_year = key
+                db.session.add(LeaveBalance(employee_id=employee_id, leave_type=leave_type,
+                                            leave_year=leave_year, used_days=actual_days))
+    
+    if fix:
+        db.session.commit()
+    return drift
+
+
+def leave_day_rows(leaves):
+    """leave_days rows for (id, employee_id, leave_type, day_type, start_date, end_date) tuples"""
+    return [
+        {'date': start_date + timedelta(days=offset), 'employee_id': employee_id, 'leave_id': leave_id,
+         'leave_type': leave_type, 'day_type': day_type or 'Full Day'}
+        for leave_id, employee_id, leave_type, day_type, start_date, end_date in leaves
+        for offset in range((end_date - start_date).days + 1)
+    ]
+
+
+def update_leave_days(leave_req, old_status, new_status):
+    """
+    Apply a leave status transition to the leave_days table
+    Like update_balance_ledger(), only transitions into or out of 'Approved'
+    matter; runs in the caller's transaction.
+    """
+    was_approved = old_status == 'Approved'
+    is_approved = new_status == 'Approved'
+    if was_approved == is_approved:
+        return
+    
+    if is_approved:
+        db.session.execute(insert(LeaveDay), leave_day_rows([(
+            leave_req.id, leave_req.employee_id, leave_req.leave_type,
+            leave_req.day_type, leave_req.start_date, leave_req.end_date
+        )]))
+    else:
+        LeaveDay.query.filter_by(leave_id=leave_req.id).delete(synchronize_session=False)
+
+
+def rebuild_leave_days():
+    """Recreate the leave_days table from approved leaves and commit; returns the number of rows"""
+    LeaveDay.query.delete(synchronize_session=False)
+    approved = db.session.query(
+        LeaveRequest.id, LeaveRequest.employee_id, LeaveRequest.leave_type,
+        LeaveRequest.day_type, LeaveRequest.start_date, LeaveRequest.end_date
+    ).filter(LeaveRequest.status == 'Approved').all()
+    rows = leave_day_rows(approved)
+    if rows:
+        db.session.execute(insert(LeaveDay), rows)
+    db.session.commit()
+    return len(rows)
+
+
+AVAILABILITY_MAX_DAYS = 62
+
+
+def get_absences(start_date, end_date, stream=None, location=None):
+    """
+    Members on approved leave each day of [start_date, end_date], from leave_days
+    Returns {date: [{'employee_id', 'employee_name', 'stream', 'location',
+    'leave_type', 'day_type'}]} with every day of the range present
+    """
+    rows = db.session.query(
+        LeaveDay.date, LeaveDay.leave_type, LeaveDay.day_type,
+        TeamMember.id, TeamMember.name, TeamMember.stream, TeamMember.location
+    ).join(TeamMember, LeaveDay.employee_id == TeamMember.id).filter(
+        LeaveDay.date >= start_date,
+        LeaveDay.date <= end_date
+    )
+    if stream:
+        rows = rows.filter(TeamMember.stream == stream)
+    if location:
+        rows = rows.filter(TeamMember.location == location)
+    
+    absences = {start_date + timedelta(days=offset): [] for offset in range((end_date - start_date).days + 1)}
+    for day, leave_type, day_type, employee_id, name, member_stream, member_location in rows.order_by(
+            LeaveDay.date, TeamMember.stream, TeamMember.name):
+        absences[day].append({
+            'employee_id': employee_id,
+            'employee_name': name,
+            'stream': member_stream,
+            'location': member_location,
+            'leave_type': leave_type,
+            'day_type': day_type,
+        })
+    return absences
+
+
+TEAM_LEAVES_PAGE_SIZE = 50
+TEAM_LEAVE_FILTERS = ('stream', 'status', 'location', 'leave_type', 'from', 'to')
+
+
+def encode_leave_cursor(leave):
+    """Keyset cursor for the position just after this leave"""
+    return f"{leave.submitted_at.isoformat()},{leave.id}"
+
+
+def decode_leave_cursor(cursor):
+    """Inverse of encode_leave_cursor; returns (submitted_at, id)"""
+    submitted_at, leave_id = cursor.split(',', 1)
+    return datetime.fromisoformat(submitted_at), int(leave_id)
+
+
+def query_team_leaves(filters, cursor=None, limit=TEAM_LEAVES_PAGE_SIZE):
+    """
+    One page of team leaves, newest first, keyset-paginated on (submitted_at, id)
+    filters may hold stream, status, location, leave_type and a from/to date range
+    (leaves overlapping the range). Returns (leaves, next_cursor or None).
+    """
+    query = LeaveRequest.query.join(
+        TeamMember, LeaveRequest.employee_id == TeamMember.id
+    ).options(contains_eager(LeaveRequest.employee))
+    
+    if filters.get('stream'):
+        query = query.filter(TeamMember.stream == filters['stream'])
+    if filters.get('location'):
+        query = query.filter(TeamMember.location == filters['location'])
+    if filters.get('status'):
+        query = query.filter(LeaveRequest.status == filters['status'])
+    if filters.get('leave_type'):
+        query = query.filter(LeaveRequest.leave_type == filters['leave_type'])
+    if filters.get('from'):
+        query = query.filter(LeaveRequest.end_date >= datetime.strptime(filters['from'], '%Y-%m-%d').date())
+    if filters.get('to'):
+        query = query.filter(LeaveRequest.start_date <= datetime.strptime(filters['to'], '%Y-%m-%d').date())
+    
+    if cursor:
+        submitted_at, leave_id = decode_leave_cursor(cursor)
+        query = query.filter(
+            (LeaveRequest.submitted_at < submitted_at) |
+            ((LeaveRequest.submitted_at == submitted_at) & (LeaveRequest.id < leave_id))
+        )
+    
+    # Fetch one extra row to know whether another page exists
+    leaves = query.order_by(
+        LeaveRequest.submitted_at.desc(), LeaveRequest.id.desc()
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(leaves) > limit:
+        leaves = leaves[:limit]
+        next_cursor = encode_leave_cursor(leaves[-1])
+    return leaves, next_cursor
+
+
+# Rows fetched per server-side cursor batch, and bytes buffered per response chunk
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def stream_json_list(key, items, extra=None):
+    """
+    Stream {"<key>": [items...], **extra} as JSON without building the list
+    items may be any iterable (e.g. a generator over a yield_per query), so
+    memory stays constant however many rows there are
+    """
+    def generate():
+        buffer = [current_app.json.dumps(extra or {})[:-1]]
+        buffer.append(f'{", " if extra else ""}"{key}": [')
+        size = 0
+        first = True
+        for item in items:
+            chunk = ('' if first else ', ') + current_app.json.dumps(item)
+            first = False
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_BYTES:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        buffer.append(']}')
+        yield ''.join(buffer)
+    
+    # Keep the request/app context alive while the generator reads from the DB
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+
+CALENDAR_FILTERS = ('start', 'end', 'stream', 'location', 'type')
+
+
+def parse_calendar_filters(args):
+    """
+    Normalize calendar query parameters
+    FullCalendar sends start/end as ISO datetimes (end exclusive); only the date part is used
+    """
+    filters = {key: args.get(key) or None for key in CALENDAR_FILTERS}
+    for key in ('start', 'end'):
+        if filters[key]:
+            filters[key] = datetime.strptime(filters[key][:10], '%Y-%m-%d').date()
+    if filters['type'] not in (None, 'holiday', 'leave'):
+        raise ValueError(f"Unknown event type: {filters['type']}")
+    return filters
+
+
+def iter_calendar_events(filters):
+    """Yield FullCalendar event dicts for holidays and approved leaves matching filters"""
+    start, end = filters['start'], filters['end']
+    
+    # Holidays (stream doesn't apply; 'Both' matches any location)
+    if filters['type'] in (None, 'holiday'):
+        holidays = Holiday.query
+        if start:
+            holidays = holidays.filter(Holiday.date >= start)
+        if end:
+            holidays = holidays.filter(Holiday.date < end)
+        if filters['location']:
+            holidays = holidays.filter(Holiday.location.in_([filters['location'], 'Both']))
+        
+        for holiday in holidays.order_by(Holiday.date).yield_per(STREAM_BATCH_SIZE):
+            color = '#2196F3' if holiday.location == 'UAE' else '#FF9800' if holiday.location == 'India' else '#4CAF50'
+            yield {
+                'title': f"🎉 {holiday.name}",
+                'start': holiday.date.strftime('%Y-%m-%d'),
+                'color': color,
+                'type': 'holiday',
+                'location': holiday.location
+            }
+    
+    # Approved leaves overlapping the window
+    if filters['type'] in (None, 'leave'):
+        leaves = LeaveRequest.query.join(
+            TeamMember, LeaveRequest.employee_id == TeamMember.id
+        ).options(contains_eager(LeaveRequest.employee)).filter(LeaveRequest.status == 'Approved')
+        if start:
+            leaves = leaves.filter(LeaveRequest.end_date >= start)
+        if end:
+            leaves = leaves.filter(LeaveRequest.start_date < end)
+        if filters['stream']:
+            leaves = leaves.filter(TeamMember.stream == filters['stream'])
+        if filters['location']:
+            leaves = leaves.filter(TeamMember.location == filters['location'])
+        
+        for leave in leaves.order_by(LeaveRequest.start_date, LeaveRequest.id).yield_per(STREAM_BATCH_SIZE):
+            yield {
+                'title': f"{leave.employee.name} - {leave.leave_type}",
+                'start': leave.start_date.strftime('%Y-%m-%d'),
+                'end': (leave.end_date + timedelta(days=1)).strftime('%Y-%m-%d'),  # FullCalendar exclusive end
+                'color': '#F44336',
+                'type': 'leave',
+                'employee_name': leave.employee.name,
+                'employee_email': leave.employee.email,
+                'employee_location': leave.employee.location,
+                'stream': leave.employee.stream,
+                'leave_type': leave.leave_type,
+                'working_days': leave.working_days,
+                'status': leave.status
+            }
+
+
+# Windows longer than this (or unbounded requests) are streamed instead of cached
+CALENDAR_CACHE_MAX_DAYS = 366
+
+
+def is_large_calendar_window(filters):
+    if not filters['start'] or not filters['end']:
+        return True
+    return (filters['end'] - filters['start']).days > CALENDAR_CACHE_MAX_DAYS
+
+
+# Serialized calendar payloads keyed by filters; team_members is included
+# because events embed employee names, streams and locations
+_calendar_cache = VersionedCache(['holidays', 'leave_requests', 'team_members'])
+
+
+def get_calendar_payload(filters):
+    """Return (json_bytes, etag) for the calendar events matching filters, cached per data version"""
+    def build():
+        payload = current_app.json.dumps({'events': list(iter_calendar_events(filters))}).encode('utf-8')
+        return payload, hashlib.sha1(payload).hexdigest()
+    
+    return _calendar_cache.get_or_build(tuple(sorted(filters.items())), build)
+
+
+# ICS subscription feeds: 'user' (own leaves), 'stream' or 'location'
+ICS_FEED_KINDS = ('user', 'stream', 'location')
+ICS_FEED_PAST_DAYS = 365  # Older leaves and holidays are left out of feeds
+ICS_FEED_REFRESH = 'PT15M'  # Poll interval suggested to calendar clients
+
+# Rendered feeds; calendar clients poll every few minutes, so an unchanged feed
+# is served from here. The TTL bounds lag behind writes in other workers.
+_ics_feed_cache = VersionedCache(['holidays', 'leave_requests', 'team_members'], max_entries=512, ttl=300)
+# feed -> (etag, last_modified), so rebuilding an unchanged feed keeps its Last-Modified
+_ics_feed_modified = {}
+# Signed token payload -> (kind, value), or False once revoked, so polls with a
+# stale link don't query the database either
+_feed_token_cache = VersionedCache(['team_members'], max_entries=1024, ttl=300)
+
+
+def get_feed_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='ics-feed')
+
+
+def make_feed_token(owner, kind, value):
+    """
+    Signed token naming a feed; it is the only credential a subscription URL carries
+    It also names the member it was issued to and their feed secret, so it stops
+    working when they regenerate their links, are deactivated or lose access.
+    """
+    return get_feed_serializer().dumps([kind, value, owner.id, owner.feed_secret])
+
+
+def can_read_feed(member, kind, value):
+    if kind == 'user':
+        return value == member.id
+    if member.role == 'scrum_master':
+        return True
+    return value == (member.stream if kind == 'stream' else member.location)
+
+
+def check_feed_owner(kind, value, owner_id, feed_secret):
+    owner = db.session.get(TeamMember, owner_id)
+    if owner is None or not owner.is_active or owner.feed_secret != feed_secret:
+        return False
+    if not can_read_feed(owner, kind, value):
+        return False
+    return kind, value
+
+
+def read_feed_token(token):
+    """(kind, value) for a valid, unrevoked feed token, else None (both answers are cached)"""
+    try:
+        kind, value, owner_id, feed_secret = get_feed_serializer().loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if kind not in ICS_FEED_KINDS or not isinstance(owner_id, int) or not isinstance(value, (int, str)):
+        return None
+    
+    payload = (kind, value, owner_id, feed_secret)
+    return _feed_token_cache.get_or_build(payload, lambda: check_feed_owner(*payload)) or None
+
+
+def regenerate_feed_secret(member):
+    """Revoke every feed URL issued to member (caller commits)"""
+    member.feed_secret = secrets.token_urlsafe(12)
+
+
+def get_feed_links(user):
+    """Subscription URLs the user may copy: own leaves, own stream and location (every one for Scrum Masters)"""
+    streams, locations = [user.stream], [user.location]
+    if user.role == 'scrum_master':
+        streams = sorted(stream for stream, in db.session.query(TeamMember.stream).distinct())
+        locations = list(import_parsers.MEMBER_LOCATIONS)
+    
+    feeds = [('user', user.id, 'My leaves')]
+    feeds += [('stream', stream, f'{stream} stream') for stream in streams]
+    feeds += [('location', location, f'{location} team') for location in locations]
+    return [
+        {'title': title, 'url': url_for('calendar_feed', token=make_feed_token(user, kind, value), _external=True)}
+        for kind, value, title in feeds
+    ]
+
+
+def ics_text(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold_ics_line(line):
+    """Fold a content line into 75-octet pieces (RFC 5545) without splitting UTF-8 characters"""
+    encoded = line.encode('utf-8')
+    chunks = []
+    limit = 75
+    while len(encoded) > limit:
+        cut = limit
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        chunks.append(encoded[:cut])
+        encoded = encoded[cut:]
+        limit = 74  # Continuation lines start with a space
+    chunks.append(encoded)
+    return b'\r\n '.join(chunks)
+
+
+def ics_event(uid, stamp, start, end, summary, description='', busy=False):
+    """Content lines of an all-day VEVENT (end inclusive)"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f"DTSTAMP:{stamp.strftime('%Y%m%dT%H%M%SZ')}",
+        f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(end + timedelta(days=1)).strftime('%Y%m%d')}",
+        f'SUMMARY:{ics_text(summary)}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{ics_text(description)}')
+    lines += [f"TRANSP:{'OPAQUE' if busy else 'TRANSPARENT'}", 'END:VEVENT']
+    return lines
+
+
+def render_ics_feed(kind, value):
+    """
+    iCalendar bytes with the approved leaves and holidays of a feed (None if it
+    names a member that no longer exists). Holidays cover the locations of the
+    feed's members; 'Both' holidays are always included.
+    """
+    since = date.today() - timedelta(days=ICS_FEED_PAST_DAYS)
+    leaves = LeaveRequest.query.join(
+        TeamMember, LeaveRequest.employee_id == TeamMember.id
+    ).options(contains_eager(LeaveRequest.employee)).filter(
+        LeaveRequest.status == 'Approved',
+        LeaveRequest.end_date >= since
+    )
+    
+    if kind == 'user':
+        member = db.session.get(TeamMember, value)
+        if member is None:
+            return None
+        name = f'Leave Tracker - {member.name}'
+        leaves = leaves.filter(TeamMember.id == member.id)
+        locations = [member.location]
+    elif kind == 'stream':
+        name = f'Leave Tracker - {value} stream'
+        leaves = leaves.filter(TeamMember.stream == value)
+        locations = [location for location, in db.session.query(TeamMember.location)
+                     .filter(TeamMember.stream == value).distinct()]
+    else:
+        name = f'Leave Tracker - {value}'
+        leaves = leaves.filter(TeamMember.location == value)
+        locations = [value]
+    
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//ADX//Leave Tracker//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ics_text(name)}',
+        f'X-PUBLISHED-TTL:{ICS_FEED_REFRESH}',
+        f'REFRESH-INTERVAL;VALUE=DURATION:{ICS_FEED_REFRESH}',
+    ]
+    
+    holidays = Holiday.query.filter(
+        Holiday.date >= since,
+        Holiday.location.in_(locations + ['Both'])
+    ).order_by(Holiday.date, Holiday.id)
+    for holiday in holidays:
+        summary = holiday.name
+        if len(locations) > 1 and holiday.location != 'Both':
+            summary += f' ({holiday.location})'
+        stamp = datetime.combine(holiday.date, datetime.min.time())
+        lines += ics_event(f'holiday-{holiday.id}@leave-tracker', stamp, holiday.date, holiday.date,
+                           summary, f'Public holiday ({holiday.location})')
+    
+    for leave in leaves.order_by(LeaveRequest.start_date, LeaveRequest.id):
+        summary = f'{leave.employee.name} - {leave.leave_type} Leave'
+        if leave.day_type and leave.day_type != 'Full Day':
+            summary += f' ({leave.day_type})'
+        lines += ics_event(f'leave-{leave.id}@leave-tracker', leave.approved_at or leave.submitted_at,
+                           leave.start_date, leave.end_date, summary,
+                           f'{leave.employee.stream} - {leave.working_days:g} working days',
+                           busy=kind == 'user')
+    
+    lines.append('END:VCALENDAR')
+    return b'\r\n'.join(fold_ics_line(line) for line in lines) + b'\r\n'
+
+
+def get_ics_feed(kind, value):
+    """Return (ics_bytes, etag, last_modified) for a feed, cached per data version (None if gone)"""
+    def build():
+        body = render_ics_feed(kind, value)
+        if body is None:
+            return None
+        etag = hashlib.sha1(body).hexdigest()
+        previous = _ics_feed_modified.get((kind, value))
+        if previous is None or previous[0] != etag:
+            previous = _ics_feed_modified[(kind, value)] = (etag, datetime.utcnow().replace(microsecond=0))
+        return body, etag, previous[1]
+    
+    return _ics_feed_cache.get_or_build((kind, value), build)
+
+
+def enqueue_email(to_emails, subject, body_html):
+    """
+    Add an email to the outbox in the current transaction (caller commits)
+    email_worker.py delivers it once the transaction has committed
+    """
+    if isinstance(to_emails, str):
+        to_emails = [to_emails]
+    
+    immediate = to_emails
+    if email_service.DIGEST_MINUTES > 0:
+        # One digest row per Scrum Master; everyone else is emailed right away
+        immediate = [email for email in to_emails if email not in email_service.SCRUM_MASTERS]
+        for email in to_emails:
+            if email in email_service.SCRUM_MASTERS:
+                db.session.add(EmailOutbox(recipients=email, subject=subject, body_html=body_html, digest=True))
+    
+    if immediate:
+        db.session.add(EmailOutbox(recipients=','.join(immediate), subject=subject, body_html=body_html))
+    return True
+
+
+email_service.set_dispatcher(enqueue_email)
+
+
+def queue_notification(notify, *args):
+    """Queue an email_service.notify_* email when EMAIL_NOTIFICATIONS is enabled"""
+    if current_app.config['EMAIL_NOTIFICATIONS']:
+        notify(*args)
+
+
+LEAVE_DECISIONS = ('approve', 'reject', 'override')
+BULK_DECISION_LIMIT = 200
+
+
+def decide_leave(leave_req, action, user, reason='', remaining=None):
+    """
+    Apply a Scrum Master decision ('approve', 'reject' or 'override') to a leave request
+    Updates the balance ledger and queues notifications in the caller's
+    transaction (caller commits). remaining is the balance after approval for
+    the notification; it is looked up when not given.
+    """
+    employee = leave_req.employee
+    start = leave_req.start_date.strftime('%d %b %Y')
+    end = leave_req.end_date.strftime('%d %b %Y')
+    
+    if action == 'reject':
+        update_balance_ledger(leave_req, leave_req.status, 'Rejected')
+        update_leave_days(leave_req, leave_req.status, 'Rejected')
+        leave_req.status = 'Rejected'
+        leave_req.rejection_reason = reason
+        queue_notification(
+            email_service.notify_leave_rejected,
+            employee.email, employee.name, leave_req.leave_type, start, end,
+            leave_req.rejection_reason
+        )
+        return
+    
+    update_balance_ledger(leave_req, leave_req.status, 'Approved')
+    update_leave_days(leave_req, leave_req.status, 'Approved')
+    leave_req.status = 'Approved'
+    leave_req.approved_by = user.id
+    leave_req.approved_at = datetime.utcnow()
+    
+    if action == 'override':
+        leave_req.override_used = True
+        leave_req.override_reason = reason
+        leave_details = f"{leave_req.leave_type} from {leave_req.start_date.strftime('%d %b')} to {end} ({leave_req.working_days} days)"
+        queue_notification(
+            email_service.notify_manager_override,
+            employee.name, employee.email, leave_req.override_reason, leave_details, user.name
+        )
+    
+    if current_app.config['EMAIL_NOTIFICATIONS']:
+        if remaining is None:
+            # Ledger already includes this leave
+            remaining = employee.get_balance(leave_req.leave_type, get_leave_year(leave_req.start_date))
+        queue_notification(
+            email_service.notify_leave_approved,
+            employee.email, employee.name, leave_req.leave_type, start, end,
+            leave_req.working_days, remaining
+        )
+
+
+def apply_leave_decisions(decisions, user, atomic=False):
+    """
+    Apply many decisions ({'leave_id', 'action', 'reason'}) in the caller's transaction
+    Approvals are re-validated as a batch: balances are debited and approved
+    leaves added to their stream as the batch goes, so two requests that only
+    conflict with each other are caught. Overrides skip validation. Returns one
+    result dict per decision; with atomic=True nothing is applied unless all succeed.
+    The affected members and streams are locked first, so concurrent decisions
+    and submissions (in any worker) can't invalidate the checks before commit.
+    """
+    leave_ids = set(decision.get('leave_id') for decision in decisions)
+    employees = TeamMember.query.join(
+        LeaveRequest, LeaveRequest.employee_id == TeamMember.id
+    ).filter(LeaveRequest.id.in_(leave_ids)).all()
+    lock_leave_writes(employees)
+    
+    # Load the leaves only once locked - a concurrent decision may just have changed them
+    leaves = {
+        leave.id: leave
+        for leave in LeaveRequest.with_employee().filter(LeaveRequest.id.in_(leave_ids)).populate_existing()
+    }
+    # Balances of the leave year each leave is booked against (usually just the current one)
+    year_members = {}
+    for leave in leaves.values():
+        year_members.setdefault(get_leave_year(leave.start_date), set()).add(leave.employee)
+    balances = {}
+    for leave_year, members in year_members.items():
+        for (member_id, leave_type), balance in get_balances(members, leave_year=leave_year).items():
+            balances[(member_id, leave_type, leave_year)] = balance
+    batch_approved = {}  # stream -> [(start, end, employee_id, name)] approved in this batch
+    
+    results = []
+    for decision in decisions:
+        leave_id = decision.get('leave_id')
+        action = decision.get('action')
+        reason = (decision.get('reason') or '').strip()
+        leave_req = leaves.get(leave_id)
+        result = {'leave_id': leave_id, 'action': action, 'success': False}
+        results.append(result)
+        
+        if action not in LEAVE_DECISIONS:
+            result['error'] = f"Unknown action '{action}'"
+            continue
+        if leave_req is None:
+            result['error'] = 'Leave request not found'
+            continue
+        if leave_req.status != 'Pending':
+            result['error'] = f'Leave request is already {leave_req.status}'
+            continue
+        if action == 'override' and not reason:
+            result['error'] = 'A reason is required for an override'
+            continue
+        
+        employee = leave_req.employee
+        balance_key = (employee.id, leave_req.leave_type, get_leave_year(leave_req.start_date))
+        if action != 'reject' and balance_key not in balances:
+            # Stored before leave types were validated - it can only be rejected
+            result['error'] = f"Unknown leave type '{leave_req.leave_type}'"
+            continue
+        if action == 'approve':
+            remaining = balances[balance_key] - leave_req.working_days
+            if remaining < 0:
+                result['error'] = (f'Insufficient {leave_req.leave_type} balance: '
+                                   f'{balances[balance_key]} days left, {leave_req.working_days} requested')
+                continue
+            
+            conflicts = [
+                {'employee_name': overlap['employee_name'],
+                 'start_date': overlap['start_date'].isoformat(), 'end_date': overlap['end_date'].isoformat()}
+                for overlap in find_overlaps(employee.id, leave_req.start_date, leave_req.end_date,
+                                             leave_req.id, fresh=True)
+            ] + [
+                {'employee_name': name, 'start_date': start.isoformat(), 'end_date': end.isoformat()}
+                for start, end, other_id, name in batch_approved.get(employee.stream, [])
+                if other_id != employee.id and start <= leave_req.end_date and end >= leave_req.start_date
+            ]
+            if conflicts:
+                result['error'] = f"Overlaps with {conflicts[0]['employee_name']} in {employee.stream}"
+                result['conflicts'] = conflicts
+                continue
+        
+        if action != 'reject':
+            balances[balance_key] -= leave_req.working_days
+            batch_approved.setdefault(employee.stream, []).append(
+                (leave_req.start_date, leave_req.end_date, employee.id, employee.name)
+            )
+        
+        decide_leave(leave_req, action, user, reason, remaining=balances.get(balance_key))
+        result['success'] = True
+        result['status'] = leave_req.status
+    
+    if atomic and not all(result['success'] for result in results):
+        for result in results:
+            if result['success']:
+                result['success'] = False
+                result['error'] = 'Not applied - another decision in the batch failed'
+                result.pop('status', None)
+    return results
+
+
+# Roles are cached per process; writes to team_members in this process
+# invalidate immediately, the TTL bounds lag behind other workers
+USER_ROLE_TTL = 30
+_user_role_cache = VersionedCache(['team_members'], max_entries=1024, ttl=USER_ROLE_TTL)
+
+
+def get_current_user():
+    """Logged-in TeamMember, loaded at most once per request (None if logged out)"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = db.session.get(TeamMember, user_id) if user_id is not None else None
+    return g.current_user
+
+
+def forget_current_user(exc=None):
+    """Teardown hook - drop the user so an app context shared by several requests (tests, scripts) can't leak it"""
+    g.pop('current_user', None)
+
+
+def get_current_role():
+    """
+    Role of the logged-in member ('' if logged out or the member was removed)
+    Uses the request's user when already loaded, else the role cache
+    """
+    if 'current_user' in g:
+        return g.current_user.role if g.current_user else ''
+    user_id = session.get('user_id')
+    if user_id is None:
+        return ''
+    
+    def build():
+        return db.session.query(TeamMember.role).filter(TeamMember.id == user_id).scalar() or ''
+    
+    return _user_role_cache.get_or_build(user_id, build)
+
+
 def login_required(f):
     """Decorator to require login"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if not get_current_role():
+            session.clear()
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
@@ -287,21 +1780,476 @@ def scrum_master_required(f):
     """Decorator to require scrum master role"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        role = get_current_role()
+        if not role:
+            session.clear()
             return redirect(url_for('login'))
-        user = TeamMember.query.get(session['user_id'])
-        if not user or user.role != 'scrum_master':
+        if role != 'scrum_master':
             flash('Access denied. Scrum Master role required.', 'error')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
 
+# ============================================================================
+# COVERAGE MATRIX
+# ============================================================================
+
+COVERAGE_MAX_DAYS = 366
+
+_coverage_cache = VersionedCache(['holidays', 'leave_requests', 'team_members', 'configuration'])
+
+
+def compute_coverage(start_date, end_date, streams=None):
+    """
+    Streams x days absence matrix for [start_date, end_date]
+    Leaves are added to per-(stream, location) difference arrays in one pass
+    over the approved rows, then prefix-summed and masked with each location's
+    working-day calendar. Absences are weighted by day type (half day = 0.5)
+    and only counted on the member's working days.
+    
+    Returns {'days', 'streams', 'headcount', 'absent', 'available'} where
+    absent[i][d] is people out and available[i][d] the fraction of the
+    stream's headcount working (0 on weekends / holidays).
+    """
+    num_days = (end_date - start_date).days + 1
+    
+    members = TeamMember.query.filter_by(is_active=True)
+    if streams:
+        members = members.filter(TeamMember.stream.in_(streams))
+    members = members.with_entities(TeamMember.id, TeamMember.stream, TeamMember.location).all()
+    
+    stream_names = sorted(set(stream for _, stream, _ in members))
+    member_groups = {member_id: (stream, location) for member_id, stream, location in members}
+    groups = sorted(set(member_groups.values()))
+    group_size = {group: 0 for group in groups}
+    for group in member_groups.values():
+        group_size[group] += 1
+    
+    # Working-day mask per location, taken from the cached calendar index
+    locations = set(location for _, location in groups)
+    calendars = load_working_day_calendars(
+        (location, year) for location in locations
+        for year in range(start_date.year, end_date.year + 1)
+    )
+    days = [start_date + timedelta(days=offset) for offset in range(num_days)]
+    working = {
+        location: [calendars[(location, day.year)].is_working_day(day) for day in days]
+        for location in locations
+    }
+    
+    # One pass over approved leaves: +weight at start, -weight after end
+    diffs = {group: [0] * (num_days + 1) for group in groups}
+    leaves = db.session.query(
+        LeaveRequest.employee_id, LeaveRequest.start_date,
+        LeaveRequest.end_date, LeaveRequest.day_type
+    ).filter(
+        LeaveRequest.status == 'Approved',
+        LeaveRequest.start_date <= end_date,
+        LeaveRequest.end_date >= start_date,
+        LeaveRequest.employee_id.in_(list(member_groups))
+    )
+    for employee_id, leave_start, leave_end, day_type in leaves:
+        diff = diffs[member_groups[employee_id]]
+        weight = DAY_TYPE_FRACTIONS.get(day_type, 1)
+        diff[max((leave_start - start_date).days, 0)] += weight
+        diff[min((leave_end - start_date).days, num_days - 1) + 1] -= weight
+    
+    absent = {stream: [0] * num_days for stream in stream_names}
+    present = {stream: [0] * num_days for stream in stream_names}
+    for (stream, location), diff in diffs.items():
+        mask = working[location]
+        size = group_size[(stream, location)]
+        out = 0
+        for d in range(num_days):
+            out += diff[d]
+            if mask[d]:
+                absent[stream][d] += out
+                present[stream][d] += size - out
+    
+    headcount = {stream: 0 for stream in stream_names}
+    for (stream, _), size in group_size.items():
+        headcount[stream] += size
+    
+    return {
+        'days': [day.strftime('%Y-%m-%d') for day in days],
+        'streams': stream_names,
+        'headcount': headcount,
+        'absent': [absent[stream] for stream in stream_names],
+        'available': [
+            [round(count / headcount[stream], 4) for count in present[stream]]
+            for stream in stream_names
+        ]
+    }
+
+
+def get_coverage(start_date, end_date, streams=None):
+    """Cached compute_coverage(), reused until leaves, holidays or members change"""
+    key = (start_date, end_date, tuple(sorted(streams or ())))
+    return _coverage_cache.get_or_build(key, lambda: compute_coverage(start_date, end_date, streams))
+
+
+# ============================================================================
+# SPRINT CAPACITY
+# ============================================================================
+
+SPRINT_CAPACITY_TTL = 60
+
+# sprint_id -> (start_date, end_date, created, capacity); see _invalidate_sprint_capacity
+_sprint_capacity_cache = {}
+_sprint_capacity_lock = threading.Lock()
+_sprint_capacity_generation = 0
+
+
+def compute_sprint_capacity(sprint):
+    """
+    Available person-days per member and per stream for a sprint
+    Builds a members x days matrix: 1 on the member's working days (location
+    weekends and holidays, including 'Both', excluded) minus the day_type
+    fraction of any approved leave covering that day.
+    """
+    days = [sprint.start_date + timedelta(days=offset)
+            for offset in range((sprint.end_date - sprint.start_date).days + 1)]
+    members = TeamMember.query.filter_by(is_active=True).order_by(TeamMember.stream, TeamMember.name).all()
+    
+    locations = set(member.location for member in members)
+    calendars = load_working_day_calendars(
+        (location, year) for location in locations
+        for year in range(sprint.start_date.year, sprint.end_date.year + 1)
+    )
+    working = {
+        location: [1 if calendars[(location, day.year)].is_working_day(day) else 0 for day in days]
+        for location in locations
+    }
+    
+    matrix = {member.id: list(working[member.location]) for member in members}
+    leaves = db.session.query(
+        LeaveRequest.employee_id, LeaveRequest.start_date,
+        LeaveRequest.end_date, LeaveRequest.day_type
+    ).filter(
+        LeaveRequest.status == 'Approved',
+        LeaveRequest.start_date <= sprint.end_date,
+        LeaveRequest.end_date >= sprint.start_date,
+        LeaveRequest.employee_id.in_(list(matrix))
+    )
+    for employee_id, leave_start, leave_end, day_type in leaves:
+        row = matrix[employee_id]
+        fraction = DAY_TYPE_FRACTIONS.get(day_type, 1)
+        first = max((leave_start - sprint.start_date).days, 0)
+        last = min((leave_end - sprint.start_date).days, len(days) - 1)
+        for d in range(first, last + 1):
+            row[d] = max(row[d] - fraction, 0)
+    
+    member_rows = []
+    streams = {}
+    for member in members:
+        working_days = sum(working[member.location])
+        available_days = sum(matrix[member.id])
+        row = {
+            'id': member.id,
+            'name': member.name,
+            'stream': member.stream,
+            'location': member.location,
+            'working_days': working_days,
+            'leave_days': working_days - available_days,
+            'available_days': available_days
+        }
+        member_rows.append(row)
+        
+        stream = streams.setdefault(member.stream, {
+            'stream': member.stream, 'members': 0,
+            'working_days': 0, 'leave_days': 0, 'available_days': 0
+        })
+        stream['members'] += 1
+        for key in ('working_days', 'leave_days', 'available_days'):
+            stream[key] += row[key]
+    
+    for stream in streams.values():
+        stream['availability'] = round(stream['available_days'] / stream['working_days'], 4) if stream['working_days'] else 0
+    
+    return {
+        'sprint': sprint.to_dict(),
+        'days': [day.strftime('%Y-%m-%d') for day in days],
+        'members': member_rows,
+        'streams': [streams[name] for name in sorted(streams)],
+        'totals': {
+            key: sum(stream[key] for stream in streams.values())
+            for key in ('members', 'working_days', 'leave_days', 'available_days')
+        }
+    }
+
+
+def get_sprint_capacity(sprint):
+    """Cached compute_sprint_capacity(); entries are dropped only when their sprint is affected"""
+    entry = _sprint_capacity_cache.get(sprint.id)
+    if entry and time.monotonic() - entry[2] <= SPRINT_CAPACITY_TTL:
+        return entry[3]
+    
+    generation = _sprint_capacity_generation
+    capacity = compute_sprint_capacity(sprint)
+    with _sprint_capacity_lock:
+        # Don't cache a result built from data that changed mid-build
+        if generation == _sprint_capacity_generation:
+            _sprint_capacity_cache[sprint.id] = (sprint.start_date, sprint.end_date, time.monotonic(), capacity)
+    return capacity
+
+
+@on_data_change
+def _invalidate_sprint_capacity(changed_tables, changed_leaves):
+    """Leave changes drop only the sprints their dates overlap; other changes drop everything"""
+    global _sprint_capacity_generation
+    if not changed_tables & {'leave_requests', 'holidays', 'configuration', 'team_members', 'sprints'}:
+        return
+    
+    with _sprint_capacity_lock:
+        _sprint_capacity_generation += 1
+        if changed_tables & {'holidays', 'configuration', 'team_members', 'sprints'} or changed_leaves is None:
+            _sprint_capacity_cache.clear()
+            return
+        for sprint_id, (start_date, end_date, _, _) in list(_sprint_capacity_cache.items()):
+            if any(leave_start <= end_date and leave_end >= start_date
+                   for _, leave_start, leave_end in changed_leaves):
+                del _sprint_capacity_cache[sprint_id]
+
+
+# ============================================================================
+# BULK IMPORT
+# ============================================================================
+
+# Member columns an import may set; columns missing from a row keep their current value
+MEMBER_IMPORT_FIELDS = ('name', 'stream', 'location', 'role', 'annual_entitlement',
+                        'sick_entitlement', 'is_active')
+
+
+def import_team_members(rows, deactivate_missing=False):
+    """
+    Upsert team members (rows from import_parsers.parse_members_csv), keyed by email
+    Diffs against the existing roster in one query: new members are bulk
+    inserted and changed ones bulk updated; unchanged rows aren't touched.
+    With deactivate_missing, active members absent from rows are deactivated
+    (never deleted - they own leave history). Runs in the caller's transaction.
+    """
+    columns = [getattr(TeamMember, field) for field in MEMBER_IMPORT_FIELDS]
+    existing = {
+        member.email.lower(): member
+        for member in db.session.query(TeamMember.id, TeamMember.email, *columns)
+    }
+    
+    inserts, updates = [], []
+    result = {'inserted': [], 'updated': [], 'unchanged': 0, 'deactivated': []}
+    for row in rows:
+        current = existing.get(row['email'])
+        if current is None:
+            inserts.append(row)
+            result['inserted'].append(row['email'])
+            continue
+        changes = {field: row[field] for field in MEMBER_IMPORT_FIELDS
+                   if field in row and getattr(current, field) != row[field]}
+        if changes:
+            updates.append(dict(changes, id=current.id))
+            result['updated'].append(row['email'])
+        else:
+            result['unchanged'] += 1
+    
+    if inserts:
+        db.session.execute(insert(TeamMember), inserts)
+    if updates:
+        db.session.execute(update(TeamMember), updates)
+    
+    if deactivate_missing:
+        incoming = set(row['email'] for row in rows)
+        missing = {email: member.id for email, member in existing.items()
+                   if email not in incoming and member.is_active}
+        if missing:
+            TeamMember.query.filter(TeamMember.id.in_(missing.values())).update(
+                {TeamMember.is_active: False}, synchronize_session=False
+            )
+        result['deactivated'] = sorted(missing)
+    
+    return result
+
+
+def import_holidays(rows, prune=False):
+    """
+    Upsert holidays (rows from import_parsers.parse_holidays), keyed by (date, location)
+    New holidays are bulk inserted and renamed/recolored ones bulk updated. With
+    prune, existing holidays of the same locations in the years covered by rows
+    that the import doesn't list are deleted. Runs in the caller's transaction.
+    """
+    result = {'inserted': [], 'updated': [], 'unchanged': 0, 'deleted': []}
+    if not rows:
+        return result
+    
+    incoming = {(row['date'], row['location']): row for row in rows}  # Last row wins
+    years = set(day.year for day, _ in incoming)
+    locations = set(location for _, location in incoming)
+    existing = {
+        (holiday.date, holiday.location): holiday
+        for holiday in db.session.query(Holiday.id, Holiday.name, Holiday.date, Holiday.location, Holiday.color)
+        .filter(Holiday.date >= date(min(years), 1, 1), Holiday.date <= date(max(years), 12, 31))
+    }
+    
+    inserts, updates = [], []
+    for key, row in incoming.items():
+        label = f"{row['date'].isoformat()} {row['location']}: {row['name']}"
+        current = existing.get(key)
+        if current is None:
+            inserts.append(row)
+            result['inserted'].append(label)
+        elif current.name != row['name'] or current.color != row['color']:
+            updates.append({'id': current.id, 'name': row['name'], 'color': row['color']})
+            result['updated'].append(label)
+        else:
+            result['unchanged'] += 1
+    
+    if inserts:
+        db.session.execute(insert(Holiday), inserts)
+    if updates:
+        db.session.execute(update(Holiday), updates)
+    
+    if prune:
+        stale = {key: holiday for key, holiday in existing.items()
+                 if key not in incoming and key[0].year in years and key[1] in locations}
+        if stale:
+            Holiday.query.filter(Holiday.id.in_([holiday.id for holiday in stale.values()])).delete(
+                synchronize_session=False
+            )
+        result['deleted'] = sorted(f"{day.isoformat()} {location}: {holiday.name}"
+                                   for (day, location), holiday in stale.items())
+    
+    return result
+
+
+# ============================================================================
+# SQL PROFILING
+# ============================================================================
+
+# Requests kept per endpoint for the rolling aggregates, and slowest statements reported
+PROFILE_WINDOW = 200
+PROFILE_SLOWEST = 5
+
+slow_query_log = logging.getLogger('leave_tracker.slow_query')
+
+
+class SQLProfiler:
+    """
+    Opt-in SQL instrumentation (SQL_PROFILING=true)
+    Counts statements and DB time per request from engine events, logs
+    statements slower than slow_query_ms as JSON lines and keeps rolling
+    per-endpoint aggregates. Each worker process keeps its own aggregates.
+    """
+    
+    def __init__(self, slow_query_ms=200, window=PROFILE_WINDOW):
+        self.slow_query_ms = slow_query_ms
+        self.window = window
+        self._endpoints = {}
+        self._lock = threading.Lock()
+    
+    def install(self, app, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+    
+    def _start_request(self):
+        g.sql_profile = {'started': time.perf_counter(), 'statements': 0, 'db_ms': 0.0, 'slowest': []}
+    
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's execution context, so a statement that fails
+        # (no after_cursor_execute) leaves nothing behind on the connection
+        started = time.perf_counter()
+        if context is not None:
+            context.profile_started = started
+        else:
+            conn.info['profile_started'] = started
+    
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            started = context.profile_started
+        else:
+            started = conn.info.pop('profile_started')
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        in_request = has_request_context()
+        
+        profile = g.get('sql_profile') if in_request else None
+        if profile is not None:
+            profile['statements'] += 1
+            profile['db_ms'] += elapsed_ms
+            slowest = profile['slowest']
+            slowest.append((elapsed_ms, statement))
+            if len(slowest) > PROFILE_SLOWEST:
+                slowest.sort(reverse=True)
+                del slowest[PROFILE_SLOWEST:]
+        
+        if elapsed_ms >= self.slow_query_ms:
+            # Parameters are left out - they carry names and emails
+            slow_query_log.warning(json.dumps({
+                'event': 'slow_query',
+                'endpoint': request.endpoint if in_request else None,
+                'duration_ms': round(elapsed_ms, 1),
+                'statement': ' '.join(statement.split()),
+                'executemany': executemany,
+            }))
+    
+    def _finish_request(self, exc=None):
+        profile = g.pop('sql_profile', None)
+        endpoint = request.endpoint
+        if profile is None or endpoint in (None, 'static'):
+            return
+        
+        total_ms = (time.perf_counter() - profile['started']) * 1000
+        with self._lock:
+            requests = self._endpoints.get(endpoint)
+            if requests is None:
+                requests = self._endpoints[endpoint] = deque(maxlen=self.window)
+            requests.append((profile['statements'], profile['db_ms'], total_ms, profile['slowest']))
+    
+    def summary(self):
+        """Rolling aggregates per endpoint, most total DB time first"""
+        with self._lock:
+            snapshot = {endpoint: list(requests) for endpoint, requests in self._endpoints.items()}
+        
+        rows = []
+        for endpoint, requests in snapshot.items():
+            count = len(requests)
+            db_times = sorted(db_ms for _, db_ms, _, _ in requests)
+            db_total = sum(db_times)
+            total = sum(total_ms for _, _, total_ms, _ in requests)
+            
+            slowest = {}
+            for _, _, _, statements in requests:
+                for elapsed_ms, statement in statements:
+                    slowest[statement] = max(elapsed_ms, slowest.get(statement, 0))
+            
+            rows.append({
+                'endpoint': endpoint,
+                'requests': count,
+                'avg_statements': round(sum(r[0] for r in requests) / count, 1),
+                'max_statements': max(r[0] for r in requests),
+                'db_ms_total': round(db_total, 1),
+                'avg_db_ms': round(db_total / count, 1),
+                'p95_db_ms': round(db_times[int(0.95 * (count - 1))], 1),
+                'avg_total_ms': round(total / count, 1),
+                'db_share': db_total / total if total else 0,
+                'slowest': [
+                    {'statement': ' '.join(statement.split()), 'duration_ms': round(elapsed_ms, 1)}
+                    for statement, elapsed_ms in sorted(slowest.items(), key=lambda item: -item[1])[:PROFILE_SLOWEST]
+                ],
+            })
+        
+        rows.sort(key=lambda row: row['db_ms_total'], reverse=True)
+        return rows
+    
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
 # ============================================================================
 # ROUTES
 # ============================================================================
 
-@app.route('/')
+@route('/')
 def index():
     """Landing page - redirect to login or dashboard"""
     if 'user_id' in session:
@@ -309,7 +2257,7 @@ def index():
     return redirect(url_for('login'))
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     """Login page"""
     if request.method == 'POST':
@@ -330,7 +2278,7 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     """Logout"""
     session.clear()
@@ -338,15 +2286,16 @@ def logout():
     return redirect(url_for('login'))
 
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     """Main dashboard"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     
     # Get user's leave statistics
-    annual_balance = user.get_balance('Annual')
-    sick_balance = user.get_balance('Sick')
+    balances = get_balances([user])
+    annual_balance = balances[(user.id, 'Annual')]
+    sick_balance = balances[(user.id, 'Sick')]
     
     # Get pending leaves
     pending_leaves = LeaveRequest.query.filter_by(
@@ -365,28 +2314,39 @@ def dashboard():
     # Get active sprint
     active_sprint = Sprint.query.filter_by(is_active=True).first()
     
+    # Who's out: today across the team, the next 7 days in the user's stream
+    today = date.today()
+    absences = get_absences(today, today + timedelta(days=6))
+    out_today = absences[today]
+    stream_week = [
+        (day, [absence for absence in out if absence['stream'] == user.stream])
+        for day, out in absences.items()
+    ]
+    
     return render_template('dashboard.html',
                          user=user,
                          annual_balance=annual_balance,
                          sick_balance=sick_balance,
                          pending_leaves=pending_leaves,
                          upcoming_leaves=upcoming_leaves,
-                         active_sprint=active_sprint)
+                         active_sprint=active_sprint,
+                         out_today=out_today,
+                         stream_week=stream_week)
 
 
-@app.route('/calendar')
+@route('/calendar')
 @login_required
 def calendar_view():
     """Calendar view"""
-    user = TeamMember.query.get(session['user_id'])
-    return render_template('calendar.html', user=user)
+    user = get_current_user()
+    return render_template('calendar.html', user=user, feeds=get_feed_links(user))
 
 
-@app.route('/leave/request', methods=['GET', 'POST'])
+@route('/leave/request', methods=['GET', 'POST'])
 @login_required
 def leave_request():
     """Leave request form"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     
     if request.method == 'POST':
         return submit_leave_request()
@@ -402,13 +2362,11 @@ def leave_request():
                          today=today)
 
 
-@app.route('/leave/submit', methods=['POST'])
+@route('/leave/submit', methods=['POST'])
 @login_required
 def submit_leave_request():
     """Submit leave request"""
-    # EMAIL NOTIFICATIONS DISABLED - All email imports removed
-    
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     
     leave_type = request.form.get('leave_type')
     start_date = datetime.strptime(request.form.get('start_date'), '%Y-%m-%d').date()
@@ -416,44 +2374,62 @@ def submit_leave_request():
     day_type = request.form.get('day_type', 'Full Day')
     reason = request.form.get('reason', '')
     
-    # Calculate working days
-    base_working_days = calculate_working_days(start_date, end_date, user.location)
+    # Both are stored as-is and key balances and fractions, so only known values get in
+    if leave_type not in LEAVE_TYPES or day_type not in DAY_TYPE_FRACTIONS:
+        flash('Please choose a valid leave type and day type.', 'error')
+        return redirect(url_for('leave_request'))
+    
+    # Calculate working days - stored on the request, so read holidays from the database
+    base_working_days = calculate_working_days(start_date, end_date, user.location, fresh=True)
     
     # Apply day type multiplier
-    if day_type == 'Half Day':
-        working_days = base_working_days * 0.5
-    elif day_type == 'Quarter Day':
-        working_days = base_working_days * 0.25
-    else:  # Full Day
-        working_days = base_working_days
+    working_days = base_working_days * DAY_TYPE_FRACTIONS[day_type]
+    
+    # Hold this member and stream until commit so concurrent submissions and
+    # approvals in other workers can't slip between the checks and the insert
+    lock_leave_writes([user])
+    
+    # One request per member per day - also stops double-submitted forms
+    existing = LeaveRequest.query.filter(
+        LeaveRequest.employee_id == user.id,
+        LeaveRequest.status.in_(['Pending', 'Approved']),
+        LeaveRequest.start_date <= end_date,
+        LeaveRequest.end_date >= start_date
+    ).first()
+    if existing:
+        db.session.rollback()
+        flash(f'You already have a {existing.status.lower()} {existing.leave_type} request from '
+              f"{existing.start_date.strftime('%d %b %Y')} to {existing.end_date.strftime('%d %b %Y')}.", 'error')
+        return redirect(url_for('leave_request'))
     
     # Check sufficient balance
-    sufficient, current_balance, remaining = check_sufficient_balance(user.id, leave_type, working_days)
+    sufficient, current_balance, remaining = check_sufficient_balance(user.id, leave_type, working_days,
+                                                                      get_leave_year(start_date))
     
     if not sufficient:
-        # EMAIL NOTIFICATION DISABLED
-        # from email_service import notify_insufficient_balance
-        # notify_insufficient_balance(
-        #     user.email, user.name, leave_type,
-        #     working_days, current_balance, abs(remaining)
-        # )
+        queue_notification(
+            email_service.notify_insufficient_balance,
+            user.email, user.name, leave_type,
+            working_days, current_balance, abs(remaining)
+        )
+        db.session.commit()
         flash(f'Insufficient {leave_type} leave balance. You need {abs(remaining)} more days.', 'error')
         return redirect(url_for('leave_request'))
     
-    # Check overlap
-    has_overlap, overlapping_name, overlapping_dates = check_overlap(user.id, start_date, end_date)
-    
-    if has_overlap:
-        # EMAIL NOTIFICATION DISABLED
-        # from email_service import notify_overlap_blocked
-        # notify_overlap_blocked(
-        #     user.email, user.name, overlapping_name,
-        #     overlapping_dates, start_date, end_date
-        # )
-        flash(f'Cannot submit: {overlapping_name} from your stream already has approved leave during this period.', 'error')
+    # Check overlap against the database - the cached index may lag other workers
+    overlaps = find_overlaps(user.id, start_date, end_date, fresh=True)
+    
+    if overlaps:
+        queue_notification(
+            email_service.notify_overlap_blocked,
+            user.email, user.name, overlaps[0]['employee_name'],
+            (overlaps[0]['start_date'], overlaps[0]['end_date']), start_date, end_date
+        )
+        db.session.commit()
+        names = ', '.join(sorted(set(overlap['employee_name'] for overlap in overlaps)))
+        flash(f'Cannot submit: {names} from your stream already has approved leave during this period.', 'error')
         return redirect(url_for('leave_request'))
     
-    # Create leave request
     # Create leave request
     leave_req = LeaveRequest(
         employee_id=user.id,
@@ -467,89 +2443,122 @@ def submit_leave_request():
     )
     
     db.session.add(leave_req)
+    db.session.flush()  # Assign leave_req.id for the notification
+    
+    queue_notification(
+        email_service.notify_new_leave_request,
+        user.name, user.email, user.stream, leave_type,
+        start_date.strftime('%d %b %Y'),
+        end_date.strftime('%d %b %Y'),
+        working_days, reason, leave_req.id
+    )
     db.session.commit()
     
-    # EMAIL NOTIFICATIONS DISABLED - Team will notify Scrum Masters directly
-    # from email_service import notify_new_leave_request
-    # notify_new_leave_request(
-    #     user.name, user.email, user.stream, leave_type,
-    #     start_date.strftime('%d %b %Y'),
-    #     end_date.strftime('%d %b %Y'),
-    #     working_days, reason, leave_req.id
-    # )
-    
     flash('Leave request submitted successfully! Please notify your Scrum Master to review.', 'success')
     return redirect(url_for('my_leaves'))
 
 
-@app.route('/leave/my-leaves')
+@route('/leave/my-leaves')
 @login_required
 def my_leaves():
     """View user's leaves"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     leaves = LeaveRequest.query.filter_by(employee_id=user.id).order_by(LeaveRequest.submitted_at.desc()).all()
     
     return render_template('my_leaves.html', user=user, leaves=leaves)
 
 
-@app.route('/leave/team-leaves')
+@route('/leave/team-leaves')
 @login_required
 def team_leaves():
-    """View all team leaves"""
-    user = TeamMember.query.get(session['user_id'])
-    leaves = LeaveRequest.query.order_by(LeaveRequest.submitted_at.desc()).all()
-    return render_template('team_leaves.html', user=user, leaves=leaves)
+    """View team leaves (first page; later pages load from /api/team-leaves)"""
+    user = get_current_user()
+    filters = {key: request.args.get(key, '') for key in TEAM_LEAVE_FILTERS}
+    
+    try:
+        leaves, next_cursor = query_team_leaves(filters)
+    except ValueError:
+        flash('Invalid date filter', 'error')
+        return redirect(url_for('team_leaves'))
+    
+    return render_template('team_leaves.html', user=user, leaves=leaves,
+                           filters=filters, next_cursor=next_cursor)
 
 
-@app.route('/admin')
+@route('/admin')
 @login_required
 @scrum_master_required
 def admin_panel():
     """Admin panel for Scrum Masters"""
-    user = TeamMember.query.get(session['user_id'])
-    pending_leaves = LeaveRequest.query.filter_by(status='Pending').order_by(LeaveRequest.submitted_at).all()
+    user = get_current_user()
+    pending_leaves = LeaveRequest.with_employee().filter_by(status='Pending').order_by(LeaveRequest.submitted_at).all()
+    balances = get_balances(set(leave.employee for leave in pending_leaves))
     
-    return render_template('admin.html', user=user, pending_leaves=pending_leaves)
+    return render_template('admin.html', user=user, pending_leaves=pending_leaves, balances=balances)
 
 
-@app.route('/admin/team')
+@route('/admin/team')
 @login_required
 @scrum_master_required
 def team_management():
     """Manage team members"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     team_members = TeamMember.query.filter_by(is_active=True).order_by(TeamMember.stream, TeamMember.name).all()
+    balances = get_balances(team_members)
     
-    return render_template('team_management.html', user=user, team_members=team_members)
+    return render_template('team_management.html', user=user, team_members=team_members, balances=balances)
 
 
-@app.route('/admin/holidays')
+@route('/admin/holidays')
 @login_required
 @scrum_master_required
 def holiday_management():
     """Manage holidays"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     holidays = Holiday.query.order_by(Holiday.date).all()
     
     return render_template('holiday_management.html', user=user, holidays=holidays)
 
 
-@app.route('/admin/sprint-capacity')
+@route('/admin/sprint-capacity')
 @login_required
 @scrum_master_required
 def sprint_capacity():
     """Sprint capacity planning"""
-    user = TeamMember.query.get(session['user_id'])
+    user = get_current_user()
     sprints = Sprint.query.order_by(Sprint.start_date.desc()).all()
     
-    return render_template('sprint_capacity.html', user=user, sprints=sprints)
+    # Selected sprint, else the active one, else the most recent
+    selected = None
+    sprint_id = request.args.get('sprint_id', type=int)
+    if sprint_id:
+        selected = next((sprint for sprint in sprints if sprint.id == sprint_id), None)
+    if selected is None:
+        selected = next((sprint for sprint in sprints if sprint.is_active), sprints[0] if sprints else None)
+    
+    capacity = get_sprint_capacity(selected) if selected else None
+    
+    return render_template('sprint_capacity.html', user=user, sprints=sprints,
+                           selected=selected, capacity=capacity)
+
+
+@route('/admin/sql-profile')
+@login_required
+@scrum_master_required
+def sql_profile():
+    """Rolling SQL statistics per route (needs SQL_PROFILING=true)"""
+    user = get_current_user()
+    profiler = current_app.extensions.get('sql_profiler')
+    endpoints = profiler.summary() if profiler else []
+    
+    return render_template('sql_profile.html', user=user, profiler=profiler, endpoints=endpoints)
 
 
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
 
-@app.route('/api/calculate-working-days', methods=['POST'])
+@route('/api/calculate-working-days', methods=['POST'])
 @login_required
 def api_calculate_working_days():
     """API endpoint to calculate working days"""
@@ -559,6 +2568,7 @@ def api_calculate_working_days():
         start = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
         end = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
         location = data['location']
+        check_working_day_span([(start, end, location)])
         
         working_days = calculate_working_days(start, end, location)
         
@@ -571,7 +2581,37 @@ def api_calculate_working_days():
         return jsonify({'error': str(e)}), 400
 
 
-@app.route('/api/check-overlap', methods=['POST'])
+@route('/api/calculate-working-days/batch', methods=['POST'])
+@login_required
+def api_calculate_working_days_batch():
+    """API endpoint to calculate working days for many ranges in one call"""
+    data = request.get_json()
+    
+    try:
+        if len(data['ranges']) > WORKING_DAYS_BATCH_MAX_RANGES:
+            raise ValueError(f'At most {WORKING_DAYS_BATCH_MAX_RANGES} ranges per request')
+        ranges = []
+        for item in data['ranges']:
+            start = datetime.strptime(item['start_date'], '%Y-%m-%d').date()
+            end = datetime.strptime(item['end_date'], '%Y-%m-%d').date()
+            ranges.append((start, end, item['location']))
+        check_working_day_span(ranges)
+        
+        counts = calculate_working_days_batch(ranges)
+        
+        return jsonify({
+            'results': [{
+                'working_days': working_days,
+                'start_date': start.strftime('%Y-%m-%d'),
+                'end_date': end.strftime('%Y-%m-%d'),
+                'location': location
+            } for (start, end, location), working_days in zip(ranges, counts)]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@route('/api/check-overlap', methods=['POST'])
 @login_required
 def api_check_overlap():
     """API endpoint to check for overlapping leaves"""
@@ -582,164 +2622,218 @@ def api_check_overlap():
         start = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
         end = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
         
-        has_overlap, name, dates = check_overlap(employee_id, start, end)
+        overlaps = find_overlaps(employee_id, start, end)
+        first = overlaps[0] if overlaps else None
         
         return jsonify({
-            'has_overlap': has_overlap,
-            'employee_name': name,
-            'dates': [d.strftime('%Y-%m-%d') for d in dates] if dates else None
+            'has_overlap': bool(overlaps),
+            'employee_name': first['employee_name'] if first else None,
+            'dates': [first['start_date'].strftime('%Y-%m-%d'), first['end_date'].strftime('%Y-%m-%d')] if first else None,
+            'conflicts': [{
+                'employee_name': overlap['employee_name'],
+                'start_date': overlap['start_date'].strftime('%Y-%m-%d'),
+                'end_date': overlap['end_date'].strftime('%Y-%m-%d')
+            } for overlap in overlaps]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
-@app.route('/api/calendar/events')
+@route('/api/team-leaves')
 @login_required
-def api_calendar_events():
-    """Get all calendar events (holidays + leaves)"""
-    events = []
-    
-    # Add holidays
-    holidays = Holiday.query.all()
-    for holiday in holidays:
-        color = '#2196F3' if holiday.location == 'UAE' else '#FF9800' if holiday.location == 'India' else '#4CAF50'
-        events.append({
-            'title': f"🎉 {holiday.name}",
-            'start': holiday.date.strftime('%Y-%m-%d'),
-            'color': color,
-            'type': 'holiday',
-            'location': holiday.location
-        })
+def api_team_leaves():
+    """Next page of team leaves as JSON (infinite scroll)"""
+    filters = {key: request.args.get(key, '') for key in TEAM_LEAVE_FILTERS}
     
-    # Add approved leaves
-    leaves = LeaveRequest.query.filter_by(status='Approved').all()
-    for leave in leaves:
-        events.append({
-            'title': f"{leave.employee.name} - {leave.leave_type}",
-            'start': leave.start_date.strftime('%Y-%m-%d'),
-            'end': (leave.end_date + timedelta(days=1)).strftime('%Y-%m-%d'),  # FullCalendar exclusive end
-            'color': '#F44336',
-            'type': 'leave',
-            'employee_name': leave.employee.name,
-            'employee_email': leave.employee.email,
-            'employee_location': leave.employee.location,
-            'stream': leave.employee.stream,
-            'leave_type': leave.leave_type,
-            'working_days': leave.working_days,
-            'status': leave.status
-        })
+    try:
+        leaves, next_cursor = query_team_leaves(filters, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({'events': events})
+    return jsonify({
+        'leaves': [leave.to_dict() for leave in leaves],
+        'next_cursor': next_cursor
+    })
 
 
-@app.route('/api/admin/approve/<int:leave_id>', methods=['POST'])
+@route('/api/calendar/events')
 @login_required
-@scrum_master_required
-def api_admin_approve(leave_id):
-    """Approve leave request"""
-    # EMAIL NOTIFICATIONS DISABLED
-    # from email_service import notify_leave_approved
+def api_calendar_events():
+    """
+    Get calendar events (holidays + approved leaves)
+    Honors FullCalendar's start/end window and optional stream, location
+    and type (holiday or leave) filters; without them returns everything.
+    Windows up to a year are cached with ETags; larger ones are streamed.
+    """
+    try:
+        filters = parse_calendar_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    leave_req = LeaveRequest.query.get_or_404(leave_id)
-    user = TeamMember.query.get(session['user_id'])
+    # Multi-year / unbounded ranges stream rows straight from a server-side cursor
+    if is_large_calendar_window(filters):
+        return stream_json_list('events', iter_calendar_events(filters))
     
-    leave_req.status = 'Approved'
-    leave_req.approved_by = user.id
-    leave_req.approved_at = datetime.utcnow()
+    # Cached payload + strong ETag; unchanged calendars get a 304 with no DB work
+    payload, etag = get_calendar_payload(filters)
+    response = current_app.response_class(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@route('/calendar/feed/<token>.ics')
+def calendar_feed(token):
+    """
+    iCalendar subscription feed (approved leaves + holidays) for Outlook, Google, etc.
+    No login - the signed token in the URL is the credential. Polls of an
+    unchanged feed, or with a revoked token, are answered from the cache (or
+    with a 304) without DB queries.
+    """
+    feed = read_feed_token(token)
+    cached = get_ics_feed(*feed) if feed else None
+    if cached is None:
+        abort(404)
     
+    body, etag, last_modified = cached
+    response = current_app.response_class(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@route('/api/calendar/feed/regenerate', methods=['POST'])
+@login_required
+def api_regenerate_feeds():
+    """Replace the current user's feed URLs; the old ones stop working"""
+    user = get_current_user()
+    regenerate_feed_secret(user)
     db.session.commit()
+    return jsonify({'success': True, 'feeds': get_feed_links(user)})
+
+
+@route('/api/coverage')
+@login_required
+def api_coverage():
+    """Stream x day absence matrix for planning heatmaps (start, end, optional stream list)"""
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+        if end < start or (end - start).days >= COVERAGE_MAX_DAYS:
+            raise ValueError(f'Range must be 1 to {COVERAGE_MAX_DAYS} days')
+        streams = request.args.getlist('stream')
+        
+        return jsonify(get_coverage(start, end, streams))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@route('/api/availability')
+@login_required
+def api_availability():
+    """
+    Who is out each day (start, end default to today; optional stream and location)
+    Reads the materialized leave_days table, so any range is an index lookup
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else date.today()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else start
+        if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+            raise ValueError(f'Range must be 1 to {AVAILABILITY_MAX_DAYS} days')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Calculate remaining balance
-    remaining = leave_req.employee.get_balance(leave_req.leave_type)
-    
-    # EMAIL NOTIFICATION DISABLED - Employee will check their "My Leaves" page
-    # notify_leave_approved(
-    #     leave_req.employee.email,
-    #     leave_req.employee.name,
-    #     leave_req.leave_type,
-    #     leave_req.start_date.strftime('%d %b %Y'),
-    #     leave_req.end_date.strftime('%d %b %Y'),
-    #     leave_req.working_days,
-    #     remaining
-    # )
+    absences = get_absences(start, end, request.args.get('stream'), request.args.get('location'))
+    return jsonify({'days': [
+        {'date': day.strftime('%Y-%m-%d'), 'out': out}
+        for day, out in absences.items()
+    ]})
+
+
+@route('/api/sprints/<int:sprint_id>/capacity')
+@login_required
+@scrum_master_required
+def api_sprint_capacity(sprint_id):
+    """Sprint capacity per member and per stream"""
+    sprint = Sprint.query.get_or_404(sprint_id)
+    return jsonify(get_sprint_capacity(sprint))
+
+
+def run_decision(leave_id, action, reason=''):
+    """
+    Apply one Scrum Master decision through apply_leave_decisions(), so single
+    approvals get the same locking and balance / overlap validation as bulk ones
+    """
+    result = apply_leave_decisions([{'leave_id': leave_id, 'action': action, 'reason': reason}],
+                                   get_current_user())[0]
+    if not result['success']:
+        db.session.rollback()
+        status = 404 if result['error'] == 'Leave request not found' else 409
+        return jsonify({'success': False, 'error': result['error'],
+                        'conflicts': result.get('conflicts', [])}), status
     
+    db.session.commit()
     return jsonify({'success': True})
 
 
-@app.route('/api/admin/reject/<int:leave_id>', methods=['POST'])
+@route('/api/admin/approve/<int:leave_id>', methods=['POST'])
+@login_required
+@scrum_master_required
+def api_admin_approve(leave_id):
+    """Approve leave request (fails on insufficient balance or a stream overlap - use override)"""
+    return run_decision(leave_id, 'approve')
+
+
+@route('/api/admin/reject/<int:leave_id>', methods=['POST'])
 @login_required
 @scrum_master_required
 def api_admin_reject(leave_id):
     """Reject leave request"""
-    # EMAIL NOTIFICATIONS DISABLED
-    # from email_service import notify_leave_rejected
-    
-    data = request.get_json()
-    leave_req = LeaveRequest.query.get_or_404(leave_id)
-    
-    leave_req.status = 'Rejected'
-    leave_req.rejection_reason = data.get('reason', '')
-    
-    db.session.commit()
-    
-    # EMAIL NOTIFICATION DISABLED - Employee will check their "My Leaves" page
-    # notify_leave_rejected(
-    #     leave_req.employee.email,
-    #     leave_req.employee.name,
-    #     leave_req.leave_type,
-    #     leave_req.start_date.strftime('%d %b %Y'),
-    #     leave_req.end_date.strftime('%d %b %Y'),
-    #     leave_req.rejection_reason
-    # )
-    
-    return jsonify({'success': True})
+    data = request.get_json() or {}
+    return run_decision(leave_id, 'reject', data.get('reason', ''))
 
 
-@app.route('/api/admin/override/<int:leave_id>', methods=['POST'])
+@route('/api/admin/override/<int:leave_id>', methods=['POST'])
 @login_required
 @scrum_master_required
 def api_admin_override(leave_id):
     """Approve leave with manager override"""
-    # EMAIL NOTIFICATIONS DISABLED
-    # from email_service import notify_manager_override, notify_leave_approved
-    
-    data = request.get_json()
-    leave_req = LeaveRequest.query.get_or_404(leave_id)
-    user = TeamMember.query.get(session['user_id'])
-    
-    leave_req.status = 'Approved'
-    leave_req.approved_by = user.id
-    leave_req.approved_at = datetime.utcnow()
-    leave_req.override_used = True
-    leave_req.override_reason = data.get('reason', '')
-    
-    db.session.commit()
-    
-    # EMAIL NOTIFICATIONS DISABLED
-    # leave_details = f"{leave_req.leave_type} from {leave_req.start_date.strftime('%d %b')} to {leave_req.end_date.strftime('%d %b %Y')} ({leave_req.working_days} days)"
-    # notify_manager_override(
-    #     leave_req.employee.name,
-    #     leave_req.employee.email,
-    #     leave_req.override_reason,
-    #     leave_details,
-    #     user.name
-    # )
-    
-    # remaining = leave_req.employee.get_balance(leave_req.leave_type)
-    # notify_leave_approved(
-    #     leave_req.employee.email,
-    #     leave_req.employee.name,
-    #     leave_req.leave_type,
-    #     leave_req.start_date.strftime('%d %b %Y'),
-    #     leave_req.end_date.strftime('%d %b %Y'),
-    #     leave_req.working_days,
-    #     remaining
-    # )
-    
-    return jsonify({'success': True})
+    data = request.get_json() or {}
+    return run_decision(leave_id, 'override', data.get('reason', ''))
 
 
-@app.route('/api/leave/cancel/<int:leave_id>', methods=['POST'])
+@route('/api/admin/decisions', methods=['POST'])
+@login_required
+@scrum_master_required
+def api_admin_decisions():
+    """
+    Approve / reject / override many leave requests in one transaction
+    Body: {"decisions": [{"leave_id": 1, "action": "approve", "reason": ""}, ...], "atomic": false}
+    Returns a result per decision; with atomic=true nothing is saved unless all succeed
+    """
+    data = request.get_json() or {}
+    decisions = data.get('decisions')
+    if not isinstance(decisions, list) or not decisions:
+        return jsonify({'success': False, 'error': 'decisions must be a non-empty list'}), 400
+    if len(decisions) > BULK_DECISION_LIMIT:
+        return jsonify({'success': False, 'error': f'At most {BULK_DECISION_LIMIT} decisions per request'}), 400
+    if not all(isinstance(decision, dict) and isinstance(decision.get('leave_id'), int) for decision in decisions):
+        return jsonify({'success': False, 'error': 'Each decision needs an integer leave_id'}), 400
+    
+    results = apply_leave_decisions(decisions, get_current_user(), atomic=bool(data.get('atomic')))
+    applied = sum(1 for result in results if result['success'])
+    if applied:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    
+    return jsonify({'success': True, 'applied': applied, 'failed': len(results) - applied, 'results': results})
+
+
+@route('/api/leave/cancel/<int:leave_id>', methods=['POST'])
 @login_required
 def api_cancel_leave(leave_id):
     """Cancel pending leave request"""
@@ -749,19 +2843,176 @@ def api_cancel_leave(leave_id):
     if leave_req.employee_id != session['user_id']:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
     
+    # Wait for any decision in flight, then re-check the status it left behind
+    lock_leave_writes([leave_req.employee])
+    db.session.refresh(leave_req)
+    
     # Can only cancel pending requests
     if leave_req.status != 'Pending':
         return jsonify({'success': False, 'error': 'Can only cancel pending requests'}), 400
     
+    update_balance_ledger(leave_req, leave_req.status, None)
+    update_leave_days(leave_req, leave_req.status, None)
     db.session.delete(leave_req)
     db.session.commit()
     
     return jsonify({'success': True})
 
 
+def run_import(parse, apply):
+    """
+    Parse an uploaded file and apply it in one transaction
+    Form fields: file, dry_run=1 to preview the diff without saving
+    """
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'error': 'Choose a file to import'}), 400
+    
+    try:
+        rows = parse(upload.filename, upload.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    dry_run = request.form.get('dry_run') == '1'
+    try:
+        result = apply(rows)
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Import conflicts with a concurrent change - please retry'}), 409
+    except DataError:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Import has a value the database cannot store (too long or out of range)'}), 400
+    except SQLAlchemyError:
+        db.session.rollback()
+        current_app.logger.exception('Import failed')
+        return jsonify({'success': False, 'error': 'Import failed - nothing was saved'}), 500
+    
+    return jsonify(dict(result, success=True, dry_run=dry_run, rows=len(rows)))
+
+
+@route('/api/admin/import/members', methods=['POST'])
+@login_required
+@scrum_master_required
+def api_import_members():
+    """Upsert team members from a CSV upload"""
+    deactivate_missing = request.form.get('deactivate_missing') == '1'
+    return run_import(
+        lambda filename, data: import_parsers.parse_members_csv(data),
+        lambda rows: import_team_members(rows, deactivate_missing=deactivate_missing)
+    )
+
+
+@route('/api/admin/import/holidays', methods=['POST'])
+@login_required
+@scrum_master_required
+def api_import_holidays():
+    """Upsert holidays from a CSV or ICS upload"""
+    location = request.form.get('location') or None
+    prune = request.form.get('prune') == '1'
+    return run_import(
+        lambda filename, data: import_parsers.parse_holidays(filename, data, location),
+        lambda rows: import_holidays(rows, prune=prune)
+    )
+
+
+# ============================================================================
+# APPLICATION FACTORY
+# ============================================================================
+
+def get_database_url():
+    """PostgreSQL on Render (DATABASE_URL), SQLite locally"""
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return 'sqlite:///leaves.db'
+    # Fix Render's postgres:// to postgresql://
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    return database_url
+
+
+def get_engine_options(database_url):
+    """
+    SQLAlchemy engine/pool settings, tunable per deployment via environment
+    Each worker process gets its own pool, so the database must allow
+    workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+    """
+    options = {
+        # Detect connections the server closed while idle
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if not database_url.startswith('sqlite'):
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    return options
+
+
+# Fork safety: a child process (e.g. a preloaded gunicorn worker) must not
+# reuse pooled connections inherited from its parent. One hook is registered
+# per process and covers the engine of every app built by create_app
+_fork_engines = weakref.WeakSet()
+
+
+def _dispose_engines_after_fork():
+    for engine in list(_fork_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app
+    config overrides settings, e.g. {'SQLALCHEMY_DATABASE_URI': 'sqlite://'} for scripts
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Off by default - set EMAIL_NOTIFICATIONS=true and run email_worker.py to send
+    app.config['EMAIL_NOTIFICATIONS'] = os.environ.get('EMAIL_NOTIFICATIONS', 'false').lower() == 'true'
+    # Per-route SQL statistics and slow-query log (see /admin/sql-profile)
+    app.config['SQL_PROFILING'] = os.environ.get('SQL_PROFILING', 'false').lower() == 'true'
+    app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 200))
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          get_engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        print("==> Using PostgreSQL database")
+    else:
+        print("==> Using SQLite database")
+    
+    db.init_app(app)
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    app.teardown_request(forget_current_user)
+    
+    with app.app_context():
+        engine = db.engine
+    _fork_engines.add(engine)
+    
+    if app.config['SQL_PROFILING']:
+        profiler = SQLProfiler(slow_query_ms=app.config['SLOW_QUERY_MS'])
+        profiler.install(app, engine)
+        app.extensions['sql_profiler'] = profiler
+    
+    return app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
-    # Get port from environment variable (Render uses PORT)
-    import os
+    # Development server only - production runs gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 5000))
     
     print(f"==> Starting Flask app on 0.0.0.0:{port}")
@@ -771,7 +3022,6 @@ if __name__ == '__main__':
         db.create_all()
         print("==> Database ready!")
     
-    # Run app with threaded=True for better performance
     app.run(
         debug=False, 
         host='0.0.0.0', 
@@ -779,5 +3029,3 @@ if __name__ == '__main__':
         threaded=True,
         use_reloader=False
     )
-
-
@@ -0,0 +1,269 @@
+"""
+Micro-benchmarks for the core helpers
+Generates a synthetic team with years of leave history, then times each helper
+cold (caches dropped) and warm, and counts the SQL statements it issues.
+Results are compared with the stored baseline (benchmark_baseline.json) so
+performance changes show up release over release.
+
+Usage:
+    python benchmark.py                       # 20 and 500 members, 3 years - compare with baseline
+    python benchmark.py --sizes 20,500,5000   # team sizes to generate
+    python benchmark.py --years 5             # years of leave history
+    python benchmark.py --save                # record the results as the new baseline
+    python benchmark.py --check               # exit code 1 on a regression
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event, insert
+
+from app import (create_app, db, TeamMember, Holiday, LeaveRequest, rebuild_balance_ledger,
+                 calculate_working_days, check_overlap, check_sufficient_balance,
+                 _data_versions, _change_listeners)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+STREAMS = ['CRM', 'EIP', 'Website', 'Mobile', 'QA', 'Sitecore', 'Devops', 'BA']
+LOCATIONS = ['UAE', 'India']
+LEAVES_PER_YEAR = 8
+ITERATIONS = 50
+
+# A result is a regression when its warm median more than doubles (and by at
+# least MIN_REGRESSION_MS - sub-millisecond timings are noisy), or when it issues
+# more SQL statements per call than the baseline (allowing for cache TTL expiry)
+TIME_TOLERANCE = 1.0
+MIN_REGRESSION_MS = 1.0
+STATEMENT_TOLERANCE = 0.25
+
+
+def generate(members, years, end_year=2026):
+    """
+    Create a synthetic team with holidays and leave history
+    Every member takes LEAVES_PER_YEAR leaves of 1-7 days per year over the last
+    `years` years; leaves are bulk inserted so large teams stay quick to build
+    Returns the id of a Scrum Master to log in as
+    """
+    rng = random.Random(members * 1000 + years)
+    first_year = end_year - years + 1
+    db.drop_all()
+    db.create_all()
+
+    scrum_master = TeamMember(name='Scrum Master', email='sm@example.com', stream='Scrum',
+                              location='UAE', role='scrum_master')
+    db.session.add(scrum_master)
+    db.session.execute(insert(TeamMember), [
+        {'name': f'Member {i}', 'email': f'member{i}@example.com',
+         'stream': STREAMS[i % len(STREAMS)], 'location': LOCATIONS[i % len(LOCATIONS)],
+         'role': 'member', 'is_active': True}
+        for i in range(members)
+    ])
+
+    db.session.execute(insert(Holiday), [
+        {'name': f'Holiday {year}-{month}', 'date': date(year, month, 10),
+         'location': ['UAE', 'India', 'Both'][month % 3]}
+        for year in range(first_year, end_year + 1) for month in range(1, 13)
+    ])
+
+    member_ids = [row[0] for row in db.session.query(TeamMember.id)]
+    leaves = []
+    for employee_id in member_ids:
+        for year in range(first_year, end_year + 1):
+            for _ in range(LEAVES_PER_YEAR):
+                start = date(year, 1, 1) + timedelta(days=rng.randint(0, 357))
+                end = start + timedelta(days=rng.randint(0, 6))
+                leaves.append({
+                    'employee_id': employee_id, 'leave_type': rng.choice(['Annual', 'Sick']),
+                    'start_date': start, 'end_date': end, 'working_days': (end - start).days + 1,
+                    'day_type': 'Full Day', 'reason': 'Synthetic',
+                    'status': rng.choice(['Pending', 'Approved', 'Approved', 'Rejected']),
+                })
+    db.session.execute(insert(LeaveRequest), leaves)
+    db.session.commit()
+    rebuild_balance_ledger()
+    return scrum_master.id
+
+
+def reset_caches():
+    """Drop every in-process cache, as after a bulk write to all tables"""
+    tables = set(_data_versions)
+    for table in tables:
+        _data_versions[table] += 1
+    for listener in _change_listeners:
+        listener(tables, None)
+    db.session.expunge_all()
+
+
+def random_range(rng, years, max_days=14, end_year=2026):
+    start = date(end_year - years + 1, 1, 1) + timedelta(days=rng.randint(0, 365 * years - max_days))
+    return start, start + timedelta(days=rng.randint(0, max_days))
+
+
+def build_cases(client, member_ids, years):
+    """(name, fn) pairs; each fn(rng) runs one call of the helper with random inputs"""
+
+    def working_days(rng):
+        start, end = random_range(rng, years)
+        calculate_working_days(start, end, rng.choice(LOCATIONS))
+
+    def overlap(rng):
+        start, end = random_range(rng, years)
+        check_overlap(rng.choice(member_ids), start, end)
+
+    def sufficient_balance(rng):
+        check_sufficient_balance(rng.choice(member_ids), 'Annual', 3)
+
+    def get_balance(rng):
+        member = db.session.get(TeamMember, rng.choice(member_ids))
+        member.get_balance(rng.choice(['Annual', 'Sick']))
+
+    def calendar_month(rng):
+        start, _ = random_range(rng, years)
+        start = start.replace(day=1)
+        response = client.get(f'/api/calendar/events?start={start.isoformat()}'
+                              f'&end={(start + timedelta(days=42)).isoformat()}')
+        response.get_data()
+
+    def calendar_all(rng):
+        response = client.get('/api/calendar/events')
+        response.get_data()
+
+    return [
+        ('calculate_working_days', working_days),
+        ('check_overlap', overlap),
+        ('check_sufficient_balance', sufficient_balance),
+        ('TeamMember.get_balance', get_balance),
+        ('api_calendar_events (month)', calendar_month),
+        ('api_calendar_events (all)', calendar_all),
+    ]
+
+
+def measure(fn, name, iterations):
+    """
+    Time fn cold (first call after dropping caches), then warm: the same
+    `iterations` random inputs are run once to fill caches and once timed,
+    so warm numbers don't depend on the iteration count
+    """
+    seeds = [f'{name}-{i}' for i in range(iterations)]
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        reset_caches()
+        started = time.perf_counter()
+        fn(random.Random(seeds[0]))
+        cold_ms = (time.perf_counter() - started) * 1000
+        cold_statements = len(statements)
+
+        for seed in seeds[1:]:
+            fn(random.Random(seed))
+
+        del statements[:]
+        timings = []
+        for seed in seeds:
+            rng = random.Random(seed)
+            started = time.perf_counter()
+            fn(rng)
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    timings.sort()
+    return {
+        'cold_ms': round(cold_ms, 3),
+        'cold_statements': cold_statements,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 3),
+        'statements': round(len(statements) / iterations, 2),
+    }
+
+
+def run(sizes, years, iterations=ITERATIONS):
+    """Benchmark every helper for each team size; returns {'<members>x<years>y': {case: result}}"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('BENCHMARK_DATABASE_URL', 'sqlite://')})
+    results = {}
+
+    with app.app_context():
+        for members in sizes:
+            started = time.perf_counter()
+            user_id = generate(members, years)
+            print(f"\n{members} members x {years} years "
+                  f"({LeaveRequest.query.count()} leaves, generated in {time.perf_counter() - started:.1f}s)")
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+                sess['user_role'] = 'scrum_master'
+
+            member_ids = [row[0] for row in db.session.query(TeamMember.id)]
+            size_results = results[f'{members}x{years}y'] = {}
+            for name, fn in build_cases(client, member_ids, years):
+                size_results[name] = measure(fn, name, iterations)
+
+    return results
+
+
+def compare(results, baseline):
+    """Print results against the baseline; returns the number of regressions"""
+    regressions = 0
+    for size, cases in results.items():
+        print(f"\n{size}:")
+        print(f"  {'helper':30} {'cold ms':>9} {'median ms':>10} {'p95 ms':>9} {'queries':>8} {'vs baseline':>12}")
+        for name, result in cases.items():
+            base = baseline.get(size, {}).get(name)
+            note = 'new'
+            if base:
+                change = (result['median_ms'] - base['median_ms']) / base['median_ms'] if base['median_ms'] else 0
+                note = f"{change:+.0%}"
+                if (result['statements'] > base['statements'] + STATEMENT_TOLERANCE
+                        or result['cold_statements'] > base['cold_statements']):
+                    note += ' ✗ queries'
+                    regressions += 1
+                elif change > TIME_TOLERANCE and result['median_ms'] - base['median_ms'] >= MIN_REGRESSION_MS:
+                    note += ' ✗'
+                    regressions += 1
+            print(f"  {name:30} {result['cold_ms']:9.2f} {result['median_ms']:10.3f} {result['p95_ms']:9.3f} "
+                  f"{result['statements']:8} {note:>12}")
+    return regressions
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark core helpers on synthetic data')
+    parser.add_argument('--sizes', default='20,500', help='comma separated team sizes')
+    parser.add_argument('--years', type=int, default=3, help='years of leave history')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--check', action='store_true', help='exit with code 1 on a regression')
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.years, args.iterations)
+    baseline = load_baseline()
+    regressions = compare(results, baseline)
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\n✅ Baseline saved to {os.path.basename(BASELINE_FILE)}")
+    elif regressions:
+        print(f"\n❌ {regressions} regression(s) against the baseline")
+    else:
+        print("\n✅ No regressions against the baseline")
+
+    sys.exit(1 if args.check and regressions and not args.save else 0)
@@ -4,17 +4,26 @@ Sends email notifications for leave requests using Outlook SMTP
 """
 
 import smtplib
+from html import escape
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import os
+import time
 
-# SMTP Configuration
-SMTP_SERVER = 'smtp.office365.com'
-SMTP_PORT = 587
-SMTP_USER = 'ObeidH@adx.ae'
+# SMTP Configuration (override SMTP_SERVER/SMTP_PORT/SMTP_USE_TLS to point at a local stand-in)
+SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.office365.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_USER = os.environ.get('SMTP_USER', 'ObeidH@adx.ae')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')  # Set via environment variable
 
+# Digest mode: Scrum Master notifications are coalesced per recipient and sent
+# at most DIGEST_MINUTES after the oldest one was queued, or as soon as
+# DIGEST_MAX_ITEMS are waiting. 0 minutes sends every notification on its own.
+DIGEST_MINUTES = int(os.environ.get('EMAIL_DIGEST_MINUTES', 0))
+DIGEST_MAX_ITEMS = int(os.environ.get('EMAIL_DIGEST_MAX_ITEMS', 20))
+
 # Scrum Masters (recipients for all notifications)
 SCRUM_MASTERS = [
     'ObeidH@adx.ae',  # Husam Alhwadi
@@ -22,9 +31,25 @@ SCRUM_MASTERS = [
 ]
 
 
+def build_message(to_emails, subject, body_html):
+    """Build a MIME message for the given recipients"""
+    if isinstance(to_emails, str):
+        to_emails = [to_emails]
+    
+    msg = MIMEMultipart('alternative')
+    msg['From'] = SMTP_USER
+    msg['To'] = ', '.join(to_emails)
+    msg['Subject'] = subject
+    
+    # Add HTML body
+    html_part = MIMEText(body_html, 'html')
+    msg.attach(html_part)
+    return msg
+
+
 def send_email(to_emails, subject, body_html):
     """
-    Send email via Outlook SMTP
+    Send email via Outlook SMTP (one connection per message)
     
     Args:
         to_emails: List of recipient emails or single email string
@@ -38,21 +63,11 @@ def send_email(to_emails, subject, body_html):
         to_emails = [to_emails]
     
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = SMTP_USER
-        msg['To'] = ', '.join(to_emails)
-        msg['Subject'] = subject
-        
-        # Add HTML body
-        html_part = MIMEText(body_html, 'html')
-        msg.attach(html_part)
-        
-        # Connect and send
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
+        connection = SMTPConnection()
+        try:
+            connection.send(to_emails, subject, body_html)
+        finally:
+            connection.close()
         
         print(f"✓ Email sent to {', '.join(to_emails)}: {subject}")
         return True
@@ -62,12 +77,136 @@ def send_email(to_emails, subject, body_html):
         return False
 
 
+class SMTPConnection:
+    """
+    Long-lived SMTP session reused across messages
+    Connects (STARTTLS + login) lazily, checks the session with NOOP after it
+    has been idle, and reconnects once if the server dropped it. Errors from
+    send() propagate so callers can retry.
+    """
+    
+    def __init__(self, server=None, port=None, use_tls=None, user=None, password=None, idle_check=30):
+        self.server = server or SMTP_SERVER
+        self.port = port or SMTP_PORT
+        self.use_tls = SMTP_USE_TLS if use_tls is None else use_tls
+        self.user = user or SMTP_USER
+        self.password = SMTP_PASSWORD if password is None else password
+        self.idle_check = idle_check
+        self._smtp = None
+        self._last_used = 0
+    
+    def _connect(self):
+        self.close()
+        smtp = smtplib.SMTP(self.server, self.port, timeout=30)
+        if self.use_tls:
+            smtp.starttls()
+        if self.password:
+            smtp.login(self.user, self.password)
+        self._smtp = smtp
+    
+    def _ensure_connected(self):
+        if self._smtp is None:
+            self._connect()
+        elif time.monotonic() - self._last_used > self.idle_check:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._connect()
+            except (smtplib.SMTPException, OSError):
+                self._connect()
+    
+    def send(self, to_emails, subject, body_html):
+        """Send one message over the shared session"""
+        msg = build_message(to_emails, subject, body_html)
+        self._ensure_connected()
+        try:
+            self._smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Dropped between messages - reconnect and retry once
+            self._connect()
+            self._smtp.send_message(msg)
+        self._last_used = time.monotonic()
+    
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+def build_digest(items):
+    """
+    Combine queued notifications into one digest email
+    
+    Args:
+        items: List of (subject, body_html) in the order they were queued
+    
+    Returns:
+        (subject, body_html) of the digest
+    """
+    subject = f"📋 Leave Tracker Digest - {len(items)} notification{'s' if len(items) != 1 else ''}"
+    
+    sections = []
+    for item_subject, item_body in items:
+        # Keep only the <body> of each notification
+        start = item_body.find('<body>')
+        end = item_body.rfind('</body>')
+        if start != -1 and end != -1:
+            item_body = item_body[start + len('<body>'):end]
+        sections.append(f"""
+            <div class="item">
+                <h3>{escape(item_subject)}</h3>
+                {item_body}
+            </div>
+        """)
+    
+    body = f"""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+            .header {{ background-color: #2196F3; color: white; padding: 10px 20px; }}
+            .content {{ background-color: #f9f9f9; padding: 20px; margin: 20px 0; border-radius: 5px; }}
+            .detail {{ margin: 10px 0; }}
+            .label {{ font-weight: bold; color: #555; }}
+            .item {{ border-bottom: 1px solid #ddd; margin-bottom: 20px; }}
+            .footer {{ text-align: center; color: #777; font-size: 12px; margin-top: 20px; }}
+        </style>
+    </head>
+    <body>
+        <h2>📋 {len(items)} leave notification{'s' if len(items) != 1 else ''}</h2>
+        {''.join(sections)}
+    </body>
+    </html>
+    """
+    return subject, body
+
+
+# Where notify_* functions hand off messages. Defaults to sending directly;
+# the app swaps in its transactional outbox with set_dispatcher()
+_dispatch = send_email
+
+
+def set_dispatcher(dispatch):
+    """Route notifications through dispatch(to_emails, subject, body_html)"""
+    global _dispatch
+    _dispatch = dispatch
+
+
+def dispatch_email(to_emails, subject, body_html):
+    return _dispatch(to_emails, subject, body_html)
+
+
 def notify_new_leave_request(employee_name, employee_email, stream, leave_type, 
                              start_date, end_date, working_days, reason, request_id):
     """
     Notify Scrum Masters about new leave request
     """
     subject = f"🔔 New Leave Request - {employee_name}"
+    employee_name, employee_email, stream, leave_type, reason = (
+        escape(employee_name), escape(employee_email), escape(stream), escape(leave_type), escape(reason or ''))
     
     body = f"""
     <html>
@@ -124,7 +263,7 @@ def notify_new_leave_request(employee_name, employee_email, stream, leave_type,
     </html>
     """
     
-    return send_email(SCRUM_MASTERS, subject, body)
+    return dispatch_email(SCRUM_MASTERS, subject, body)
 
 
 def notify_leave_approved(employee_email, employee_name, leave_type, start_date, 
@@ -133,6 +272,7 @@ def notify_leave_approved(employee_email, employee_name, leave_type, start_date,
     Notify employee that their leave request has been approved
     """
     subject = f"✅ Leave Request Approved - {start_date} to {end_date}"
+    employee_name, leave_type = escape(employee_name), escape(leave_type)
     
     body = f"""
     <html>
@@ -180,7 +320,7 @@ def notify_leave_approved(employee_email, employee_name, leave_type, start_date,
     </html>
     """
     
-    return send_email([employee_email], subject, body)
+    return dispatch_email([employee_email], subject, body)
 
 
 def notify_leave_rejected(employee_email, employee_name, leave_type, start_date, 
@@ -190,7 +330,8 @@ def notify_leave_rejected(employee_email, employee_name, leave_type, start_date,
     """
     subject = f"❌ Leave Request Not Approved - {start_date} to {end_date}"
     
-    reason_text = f"<p><strong>Reason:</strong> {rejection_reason}</p>" if rejection_reason else ""
+    employee_name, leave_type = escape(employee_name), escape(leave_type)
+    reason_text = f"<p><strong>Reason:</strong> {escape(rejection_reason)}</p>" if rejection_reason else ""
     
     body = f"""
     <html>
@@ -237,7 +378,7 @@ def notify_leave_rejected(employee_email, employee_name, leave_type, start_date,
     
     # Send to employee and Scrum Masters
     recipients = [employee_email] + SCRUM_MASTERS
-    return send_email(recipients, subject, body)
+    return dispatch_email(recipients, subject, body)
 
 
 def notify_overlap_blocked(employee_email, employee_name, overlapping_employee, 
@@ -246,6 +387,7 @@ def notify_overlap_blocked(employee_email, employee_name, overlapping_employee,
     Notify employee that their leave request was blocked due to overlap
     """
     subject = f"⚠️ Leave Request Blocked - Overlapping Vacation"
+    employee_name, overlapping_employee = escape(employee_name), escape(overlapping_employee)
     
     body = f"""
     <html>
@@ -301,7 +443,7 @@ def notify_overlap_blocked(employee_email, employee_name, overlapping_employee,
     </html>
     """
     
-    return send_email([employee_email], subject, body)
+    return dispatch_email([employee_email], subject, body)
 
 
 def notify_insufficient_balance(employee_email, employee_name, leave_type, 
@@ -310,6 +452,7 @@ def notify_insufficient_balance(employee_email, employee_name, leave_type,
     Notify employee that their leave request was blocked due to insufficient balance
     """
     subject = f"⚠️ Leave Request Blocked - Insufficient Balance"
+    employee_name, leave_type = escape(employee_name), escape(leave_type)
     
     body = f"""
     <html>
@@ -364,7 +507,7 @@ def notify_insufficient_balance(employee_email, employee_name, leave_type,
     </html>
     """
     
-    return send_email([employee_email], subject, body)
+    return dispatch_email([employee_email], subject, body)
 
 
 def notify_manager_override(employee_name, employee_email, override_reason, 
@@ -373,6 +516,10 @@ def notify_manager_override(employee_name, employee_email, override_reason,
     Notify when manager uses override to approve exceptional leave
     """
     subject = f"🔓 Manager Override Used - {employee_name} Leave Approved"
+    # Names and free-text reasons are user input - escape them for the HTML body
+    employee_name, employee_email, override_reason, leave_details, approved_by_name = (
+        escape(employee_name), escape(employee_email), escape(override_reason or ''),
+        escape(leave_details), escape(approved_by_name))
     
     body = f"""
     <html>
@@ -425,7 +572,7 @@ def notify_manager_override(employee_name, employee_email, override_reason,
     
     # Send to both employee and Scrum Masters
     recipients = [employee_email] + SCRUM_MASTERS
-    return send_email(recipients, subject, body)
+    return dispatch_email(recipients, subject, body)
 
 
 # Test function
@@ -0,0 +1,131 @@
+"""
+Email Outbox Worker
+Delivers notifications queued in the email_outbox table over one long-lived
+SMTP connection. Rows are only visible once the request that queued them has
+committed, so an email is never sent for a change that rolled back.
+
+Failed sends are retried with exponential backoff; after MAX_ATTEMPTS the row
+is marked Failed and left for inspection.
+
+In digest mode (EMAIL_DIGEST_MINUTES > 0) Scrum Master notifications are held
+and sent per recipient as one digest, once the oldest has waited
+EMAIL_DIGEST_MINUTES or EMAIL_DIGEST_MAX_ITEMS have accumulated.
+
+Usage: python email_worker.py [--once]
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import app, db, EmailOutbox
+from email_service import SMTPConnection, build_digest, DIGEST_MINUTES, DIGEST_MAX_ITEMS
+
+POLL_INTERVAL = 5  # Seconds between outbox polls when idle
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 30  # Seconds; doubles per attempt
+BACKOFF_MAX = 3600
+
+
+def claim_batch(digest=False, limit=BATCH_SIZE):
+    """Pending rows that are due, locked so concurrent workers skip them (PostgreSQL)"""
+    query = EmailOutbox.query.filter(
+        EmailOutbox.status == 'Pending',
+        EmailOutbox.next_attempt_at <= datetime.utcnow(),
+        EmailOutbox.digest.is_(True) if digest else EmailOutbox.digest.isnot(True)
+    ).order_by(EmailOutbox.id)
+    if limit:
+        query = query.limit(limit)
+    return query.with_for_update(skip_locked=True).all()
+
+
+def mark_sent(emails):
+    now = datetime.utcnow()
+    for email in emails:
+        email.status = 'Sent'
+        email.sent_at = now
+        email.last_error = None
+
+
+def mark_failed(emails, error):
+    """Schedule a retry with exponential backoff, or give up after MAX_ATTEMPTS"""
+    for email in emails:
+        email.attempts = (email.attempts or 0) + 1
+        email.last_error = str(error)
+        if email.attempts >= MAX_ATTEMPTS:
+            email.status = 'Failed'
+            print(f"✗ Email {email.id} failed permanently: {error}")
+        else:
+            delay = min(BACKOFF_BASE * 2 ** (email.attempts - 1), BACKOFF_MAX)
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            print(f"⚠️  Email {email.id} failed (attempt {email.attempts}), retrying in {delay}s: {error}")
+
+
+def deliver_batch(connection):
+    """Send one batch of due emails; returns the number of rows processed"""
+    batch = claim_batch()
+    for email in batch:
+        try:
+            connection.send(email.recipients.split(','), email.subject, email.body_html)
+            mark_sent([email])
+            print(f"✓ Email {email.id} sent to {email.recipients}: {email.subject}")
+        except Exception as e:
+            mark_failed([email], e)
+            # Start the next message on a fresh session
+            connection.close()
+    db.session.commit()
+    return len(batch)
+
+
+def deliver_digests(connection):
+    """
+    Send a digest to every recipient whose oldest held notification has waited
+    DIGEST_MINUTES, or who has DIGEST_MAX_ITEMS waiting
+    Returns the number of rows processed
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=DIGEST_MINUTES)
+    by_recipient = {}
+    for email in claim_batch(digest=True, limit=None):
+        by_recipient.setdefault(email.recipients, []).append(email)
+
+    processed = 0
+    for recipient, emails in by_recipient.items():
+        while emails and (len(emails) >= DIGEST_MAX_ITEMS or emails[0].created_at <= cutoff):
+            chunk, emails = emails[:DIGEST_MAX_ITEMS], emails[DIGEST_MAX_ITEMS:]
+            subject, body = build_digest([(email.subject, email.body_html) for email in chunk])
+            try:
+                connection.send([recipient], subject, body)
+                mark_sent(chunk)
+                print(f"✓ Digest of {len(chunk)} sent to {recipient}")
+            except Exception as e:
+                mark_failed(chunk, e)
+                connection.close()
+            processed += len(chunk)
+    db.session.commit()
+    return processed
+
+
+def run(once=False):
+    """Drain the outbox; with once=True stop when nothing is due"""
+    connection = SMTPConnection()
+
+    with app.app_context():
+        db.create_all()
+        print("📬 Email worker started")
+        try:
+            while True:
+                processed = deliver_batch(connection)
+                deliver_digests(connection)
+                if processed == BATCH_SIZE:
+                    continue
+                if once:
+                    break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            connection.close()
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    run(once='--once' in sys.argv)
@@ -0,0 +1,34 @@
+"""
+Gunicorn configuration for production (Render)
+Start with: gunicorn -c gunicorn.conf.py app:app
+
+Multi-process, multi-thread serving. Every worker process has its own
+SQLAlchemy pool (DB_POOL_SIZE + DB_MAX_OVERFLOW connections), so keep
+workers x that total below the database's connection limit.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Processes x threads; WEB_CONCURRENCY is set by Render per instance size
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Load the app once in the master and fork workers from it. The app disposes
+# inherited DB connections in each child (see _fork_engines in app.py), so this is fork safe
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth of in-process caches
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
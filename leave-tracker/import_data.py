@@ -0,0 +1,79 @@
+"""
+Bulk Roster and Holiday Import
+Upserts team members from CSV and holidays from CSV or ICS in one transaction,
+diffing against existing rows instead of replacing them.
+
+Usage:
+    python import_data.py members roster.csv [--deactivate-missing] [--dry-run]
+    python import_data.py holidays holidays.csv [--prune] [--dry-run]
+    python import_data.py holidays india-2027.ics --location India [--prune] [--dry-run]
+
+Members CSV columns: name, email, stream, location (UAE/India) and optionally
+role, annual_entitlement, sick_entitlement, is_active.
+Holidays CSV columns: name, date (YYYY-MM-DD), location (UAE/India/Both), optional color (#RRGGBB).
+"""
+
+import argparse
+import sys
+import time
+
+import import_parsers
+from app import app, db, import_team_members, import_holidays
+
+
+CHANGE_MARKERS = {'inserted': '+', 'updated': '~', 'deactivated': '-', 'deleted': '-'}
+
+
+def print_result(result, dry_run):
+    for action, marker in CHANGE_MARKERS.items():
+        for item in result.get(action, []):
+            print(f"  {marker} {item}")
+    summary = ', '.join(f"{len(result[action])} {action}"
+                        for action in CHANGE_MARKERS if action in result)
+    print(f"{'🔍 Dry run' if dry_run else '✅ Imported'}: {summary}, {result['unchanged']} unchanged")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import team members or holidays')
+    parser.add_argument('kind', choices=['members', 'holidays'])
+    parser.add_argument('path')
+    parser.add_argument('--location', help='holiday location for ICS files or CSVs without a location column')
+    parser.add_argument('--deactivate-missing', action='store_true',
+                        help='deactivate active members missing from the file')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete holidays of the imported years/locations missing from the file')
+    parser.add_argument('--dry-run', action='store_true', help='show the changes without saving them')
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        data = f.read()
+
+    try:
+        if args.kind == 'members':
+            rows = import_parsers.parse_members_csv(data)
+        else:
+            rows = import_parsers.parse_holidays(args.path, data, args.location)
+    except ValueError as e:
+        print(f"❌ {args.path}: {e}")
+        return 1
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        if args.kind == 'members':
+            result = import_team_members(rows, deactivate_missing=args.deactivate_missing)
+        else:
+            result = import_holidays(rows, prune=args.prune)
+
+        if args.dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+
+        print_result(result, args.dry_run)
+        print(f"   {len(rows)} rows in {time.perf_counter() - started:.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Roster and Holiday File Parsing
+Turns CSV (team members, holidays) and ICS (holidays) files into validated
+rows for the bulk import in app.py. Parsing never touches the database;
+every problem in a file is reported at once as a ValueError.
+"""
+
+import csv
+import io
+import re
+from datetime import datetime, timedelta
+
+MEMBER_LOCATIONS = ('UAE', 'India')
+HOLIDAY_LOCATIONS = ('UAE', 'India', 'Both')
+ROLES = ('member', 'scrum_master')
+
+# Calendar colors used when a holiday row doesn't set one
+HOLIDAY_COLORS = {'UAE': '#2196F3', 'India': '#FF9800', 'Both': '#4CAF50'}
+COLOR_PATTERN = re.compile(r'^#[0-9A-Fa-f]{6}$')
+
+# Longest all-day ICS event accepted (guards against a mistyped DTEND)
+ICS_MAX_EVENT_DAYS = 31
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'active')
+FALSE_VALUES = ('0', 'false', 'no', 'n', 'inactive')
+
+
+def decode(data):
+    """Uploaded bytes to text (handles the BOM Excel adds to CSV exports)"""
+    if isinstance(data, bytes):
+        return data.decode('utf-8-sig')
+    return data.lstrip('\ufeff')
+
+
+def read_csv(text):
+    """Yield (line_number, row) with lower-cased, stripped column names and values"""
+    reader = csv.DictReader(io.StringIO(decode(text)))
+    if not reader.fieldnames:
+        raise ValueError('File is empty')
+    reader.fieldnames = [name.strip().lower().replace(' ', '_') for name in reader.fieldnames]
+    for row in reader:
+        if not any((value or '').strip() for value in row.values()):
+            continue
+        yield reader.line_num, {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def parse_date(value):
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d %b %Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'invalid date "{value}" (use YYYY-MM-DD)')
+
+
+def match_choice(value, choices, field):
+    """Case-insensitive match against allowed values, returning the canonical spelling"""
+    for choice in choices:
+        if value.lower() == choice.lower():
+            return choice
+    raise ValueError(f'{field} must be one of {", ".join(choices)} (got "{value}")')
+
+
+def raise_errors(errors):
+    if errors:
+        shown = errors[:20]
+        more = f' (and {len(errors) - len(shown)} more)' if len(errors) > len(shown) else ''
+        raise ValueError('; '.join(shown) + more)
+
+
+def parse_members_csv(text):
+    """
+    Parse a team roster CSV
+    Columns: name, email, stream, location (required); role, annual_entitlement,
+    sick_entitlement, is_active (optional - left unchanged on existing members
+    when absent). Returns a list of dicts keyed by model column names.
+    """
+    members = []
+    seen = {}
+    errors = []
+    for line, row in read_csv(text):
+        try:
+            missing = [field for field in ('name', 'email', 'stream', 'location') if not row.get(field)]
+            if missing:
+                raise ValueError(f'missing {", ".join(missing)}')
+
+            email = row['email'].lower()
+            if '@' not in email:
+                raise ValueError(f'invalid email "{row["email"]}"')
+            if email in seen:
+                raise ValueError(f'duplicate email {email} (also on line {seen[email]})')
+            seen[email] = line
+
+            member = {
+                'name': row['name'],
+                'email': email,
+                'stream': row['stream'],
+                'location': match_choice(row['location'], MEMBER_LOCATIONS, 'location'),
+            }
+            if row.get('role'):
+                member['role'] = match_choice(row['role'].replace(' ', '_'), ROLES, 'role')
+            for field in ('annual_entitlement', 'sick_entitlement'):
+                if row.get(field):
+                    if not row[field].isdigit():
+                        raise ValueError(f'{field} must be a whole number of days')
+                    member[field] = int(row[field])
+            if row.get('is_active'):
+                value = row['is_active'].lower()
+                if value not in TRUE_VALUES + FALSE_VALUES:
+                    raise ValueError(f'is_active must be true or false (got "{row["is_active"]}")')
+                member['is_active'] = value in TRUE_VALUES
+            members.append(member)
+        except ValueError as e:
+            errors.append(f'line {line}: {e}')
+
+    raise_errors(errors)
+    return members
+
+
+def parse_holidays_csv(text, location=None):
+    """
+    Parse a holiday CSV
+    Columns: name, date, location (optional when a default location is given), color (optional, #RRGGBB)
+    """
+    holidays = []
+    errors = []
+    for line, row in read_csv(text):
+        try:
+            if not row.get('name') or not row.get('date'):
+                raise ValueError('missing name or date')
+            row_location = row.get('location') or location
+            if not row_location:
+                raise ValueError('missing location')
+            row_location = match_choice(row_location, HOLIDAY_LOCATIONS, 'location')
+            if row.get('color') and not COLOR_PATTERN.match(row['color']):
+                raise ValueError(f'color must be a hex color such as #4CAF50 (got "{row["color"]}")')
+            holidays.append({
+                'name': row['name'],
+                'date': parse_date(row['date']),
+                'location': row_location,
+                'color': row.get('color') or HOLIDAY_COLORS[row_location],
+            })
+        except ValueError as e:
+            errors.append(f'line {line}: {e}')
+
+    raise_errors(errors)
+    return holidays
+
+
+def unfold_ics(text):
+    """Join folded ICS content lines (continuations start with a space or tab)"""
+    lines = []
+    for raw in decode(text).splitlines():
+        if raw[:1] in (' ', '\t') and lines:
+            lines[-1] += raw[1:]
+        elif raw.strip():
+            lines.append(raw)
+    return lines
+
+
+def unescape_ics(value):
+    return (value.replace('\\n', ' ').replace('\\N', ' ')
+            .replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def parse_ics_date(value):
+    """DTSTART/DTEND value (DATE or DATE-TIME) to a date"""
+    return datetime.strptime(value[:8], '%Y%m%d').date()
+
+
+def parse_holidays_ics(text, location='Both'):
+    """
+    Parse holidays from an iCalendar file (e.g. a public holiday feed)
+    Every day of a multi-day all-day event becomes a holiday; all events get `location`
+    """
+    location = match_choice(location, HOLIDAY_LOCATIONS, 'location')
+    holidays = []
+    errors = []
+    event = None
+    for number, line in enumerate(unfold_ics(text), 1):
+        name, _, value = line.partition(':')
+        name = name.partition(';')[0].upper()  # Drop parameters such as ;VALUE=DATE
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {}
+        elif name == 'END' and value.upper() == 'VEVENT' and event is not None:
+            try:
+                if 'summary' not in event or 'start' not in event:
+                    raise ValueError('event without SUMMARY or DTSTART')
+                start = event['start']
+                # DTEND is exclusive for all-day events; a missing DTEND means one day
+                end = event.get('end', start + timedelta(days=1))
+                if (end - start).days > ICS_MAX_EVENT_DAYS:
+                    raise ValueError(f'event "{event["summary"]}" is longer than {ICS_MAX_EVENT_DAYS} days')
+                day = start
+                while True:
+                    holidays.append({'name': event['summary'], 'date': day, 'location': location,
+                                     'color': HOLIDAY_COLORS[location]})
+                    day += timedelta(days=1)
+                    if day >= end:
+                        break
+            except ValueError as e:
+                errors.append(f'event ending at line {number}: {e}')
+            event = None
+        elif event is not None:
+            try:
+                if name == 'SUMMARY':
+                    event['summary'] = unescape_ics(value).strip()
+                elif name == 'DTSTART':
+                    event['start'] = parse_ics_date(value)
+                elif name == 'DTEND':
+                    event['end'] = parse_ics_date(value)
+            except ValueError:
+                errors.append(f'line {number}: invalid {name} "{value}"')
+
+    raise_errors(errors)
+    return holidays
+
+
+def parse_holidays(filename, data, location=None):
+    """Parse a holiday upload as ICS or CSV depending on its name or content"""
+    text = decode(data)
+    if (filename or '').lower().endswith('.ics') or text.lstrip().upper().startswith('BEGIN:VCALENDAR'):
+        return parse_holidays_ics(text, location or 'Both')
+    return parse_holidays_csv(text, location)
@@ -1,9 +1,10 @@
 """
 Database Initialization Script
 Loads team members and holidays into the database
+Safe to re-run: rows are upserted (see import_data.py), never wiped
 """
 
-from app import app, db, TeamMember, Holiday, Configuration
+from app import app, db, TeamMember, Holiday, Configuration, import_team_members, import_holidays
 from datetime import datetime
 
 def init_database():
@@ -14,16 +15,10 @@ def init_database():
         print("Creating database tables...")
         db.create_all()
         
-        # Clear existing data (for fresh start)
-        print("Clearing existing data...")
-        TeamMember.query.delete()
-        Holiday.query.delete()
-        Configuration.query.delete()
-        
         # ====================================================================
         # TEAM MEMBERS
         # ====================================================================
-        print("\nAdding team members...")
+        print("\nImporting team members...")
         
         team_members = [
             # Scrum Masters
@@ -63,24 +58,14 @@ def init_database():
             {'name': 'Saket Upadhyay', 'email': 'UpadhyayS@adx.ae', 'stream': 'BA', 'location': 'UAE', 'role': 'member'},
         ]
         
-        for member_data in team_members:
-            member = TeamMember(
-                name=member_data['name'],
-                email=member_data['email'].lower(),
-                stream=member_data['stream'],
-                location=member_data['location'],
-                role=member_data['role'],
-                annual_entitlement=22,
-                sick_entitlement=10,
-                is_active=True
-            )
-            db.session.add(member)
-            print(f"  ✓ Added: {member.name} ({member.stream} - {member.location})")
+        result = import_team_members([dict(member, email=member['email'].lower()) for member in team_members])
+        print(f"  ✓ {len(result['inserted'])} added, {len(result['updated'])} updated, "
+              f"{result['unchanged']} unchanged")
         
         # ====================================================================
         # HOLIDAYS 2026
         # ====================================================================
-        print("\nAdding holidays for 2026...")
+        print("\nImporting holidays for 2026...")
         
         holidays = [
             # Both Locations
@@ -120,20 +105,17 @@ def init_database():
             {'name': 'National Day Holiday (UAE)', 'date': '2026-12-03', 'location': 'UAE', 'color': '#2196F3'},
         ]
         
-        for holiday_data in holidays:
-            holiday = Holiday(
-                name=holiday_data['name'],
-                date=datetime.strptime(holiday_data['date'], '%Y-%m-%d').date(),
-                location=holiday_data['location'],
-                color=holiday_data['color']
-            )
-            db.session.add(holiday)
-            print(f"  ✓ Added: {holiday.name} ({holiday.date}) - {holiday.location}")
+        result = import_holidays([
+            dict(holiday, date=datetime.strptime(holiday['date'], '%Y-%m-%d').date())
+            for holiday in holidays
+        ])
+        print(f"  ✓ {len(result['inserted'])} added, {len(result['updated'])} updated, "
+              f"{result['unchanged']} unchanged")
         
         # ====================================================================
         # SYSTEM CONFIGURATION
         # ====================================================================
-        print("\nAdding system configuration...")
+        print("\nAdding missing system configuration...")
         
         configs = [
             {'key': 'annual_leave_days', 'value': '22', 'description': 'Annual leave entitlement in working days'},
@@ -141,9 +123,18 @@ def init_database():
             {'key': 'allow_overlap', 'value': 'false', 'description': 'Allow overlapping leaves in same stream'},
             {'key': 'allow_negative_balance', 'value': 'false', 'description': 'Allow negative leave balance'},
             {'key': 'smtp_configured', 'value': 'true', 'description': 'SMTP email configured'},
+            {'key': 'weekend_days_UAE', 'value': '5,6', 'description': 'Weekend weekdays for UAE (Mon=0 ... Sun=6)'},
+            {'key': 'weekend_days_India', 'value': '5,6', 'description': 'Weekend weekdays for India (Mon=0 ... Sun=6)'},
+            {'key': 'leave_year_start', 'value': '01-01', 'description': 'Leave year start (MM-DD); run rebuild_ledger.py after changing'},
+            {'key': 'carry_forward_Annual', 'value': '5', 'description': 'Most unused annual leave days carried into the next leave year'},
+            {'key': 'carry_forward_Sick', 'value': '0', 'description': 'Most unused sick leave days carried into the next leave year'},
         ]
         
+        # Existing keys keep their (possibly edited) values
+        existing = set(key for key, in db.session.query(Configuration.key))
         for config_data in configs:
+            if config_data['key'] in existing:
+                continue
             config = Configuration(
                 key=config_data['key'],
                 value=config_data['value'],
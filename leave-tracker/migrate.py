@@ -1,48 +1,336 @@
 """
-One-time database migration to add day_type column
-This is safe to run multiple times - it checks if column exists first
+Versioned database migrations
+Runs against the app's configured database (SQLite locally, PostgreSQL on Render).
+Applied versions are recorded in the schema_migrations table, so this is safe
+to run on every deploy - only pending migrations run.
+
+Missing tables are created from the models first; migrations then bring
+existing tables and indexes up to date. Every migration is idempotent.
 """
-import sqlite3
-import os
 
-def migrate():
-    """Add day_type column to leave_requests table if it doesn't exist"""
+import secrets
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, DateTime, Float, Integer, String, column, delete, inspect, insert, select, table, text
+from sqlalchemy.schema import CreateIndex
+
+from app import app, db
+
+MIGRATIONS = []
+
+
+def migration(version, name, transactional=True):
+    """
+    Register a migration function fn(conn)
+    Non-transactional migrations run on an autocommit connection
+    (needed for CREATE INDEX CONCURRENTLY on PostgreSQL)
+    """
+    def register(fn):
+        MIGRATIONS.append((version, name, transactional, fn))
+        return fn
+    return register
+
+
+def is_postgres(conn):
+    return conn.dialect.name == 'postgresql'
+
+
+def create_indexes(conn, table_name, index_names):
+    """
+    Create model-declared indexes if missing
+    On PostgreSQL they are built CONCURRENTLY so writes aren't blocked;
+    an invalid index left by a failed concurrent build is dropped and rebuilt
+    """
+    indexes = {index.name: index for index in db.metadata.tables[table_name].indexes}
+    for name in index_names:
+        statement = str(CreateIndex(indexes[name], if_not_exists=True).compile(dialect=conn.dialect))
+        if is_postgres(conn):
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {'name': name}).first()
+            if invalid:
+                print(f"   ⚠️  Dropping invalid index {name}")
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+            statement = statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        print(f"   ➕ {name}")
+        conn.execute(text(statement))
+
+
+# Columns the current models map that older databases lack. They are added
+# before any migration runs: ORM queries (the data migrations' helpers,
+# init_db.py, the app) select every mapped column and fail until they exist.
+# The numbered migrations that introduced them are then no-ops for the ALTER.
+MODEL_COLUMNS = [
+    ('leave_requests', 'day_type', "VARCHAR(20) DEFAULT 'Full Day'"),
+    ('email_outbox', 'digest', 'BOOLEAN DEFAULT FALSE'),
+    ('team_members', 'feed_secret', 'VARCHAR(32)'),
+]
+
+
+def add_model_columns(conn):
+    inspector = inspect(conn)
+    for table_name, column_name, definition in MODEL_COLUMNS:
+        columns = [column['name'] for column in inspector.get_columns(table_name)]
+        if column_name not in columns:
+            print(f"   ➕ {table_name}.{column_name}")
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}"))
+
+
+# Frozen table definitions for the data migrations. Migrations read and write
+# through these, never through the app's models or helpers: a migration must
+# keep working after the models gain columns or the helpers change meaning.
+team_members = table(
+    'team_members',
+    column('id', Integer), column('annual_entitlement', Integer), column('sick_entitlement', Integer),
+    column('created_at', DateTime),
+)
+leave_requests = table(
+    'leave_requests',
+    column('id', Integer), column('employee_id', Integer), column('leave_type', String),
+    column('day_type', String), column('start_date', Date), column('end_date', Date),
+    column('working_days', Float), column('status', String),
+)
+leave_balances = table(
+    'leave_balances',
+    column('employee_id', Integer), column('leave_type', String), column('leave_year', Integer),
+    column('used_days', Float), column('updated_at', DateTime),
+)
+leave_days = table(
+    'leave_days',
+    column('date', Date), column('employee_id', Integer), column('leave_id', Integer),
+    column('leave_type', String), column('day_type', String),
+)
+leave_year_snapshots = table(
+    'leave_year_snapshots',
+    column('employee_id', Integer), column('leave_type', String), column('leave_year', Integer),
+    column('entitlement', Float), column('carried_in', Float), column('used_days', Float),
+    column('closing_balance', Float), column('carried_forward', Float), column('created_at', DateTime),
+)
+configuration = table('configuration', column('key', String), column('value', String))
+
+
+def rewrite_ledger(conn, leave_year_of):
+    """Replace leave_balances with approved usage per member, type and leave_year_of(start_date)"""
+    used = {}
+    approved = conn.execute(select(
+        leave_requests.c.employee_id, leave_requests.c.leave_type,
+        leave_requests.c.start_date, leave_requests.c.working_days
+    ).where(leave_requests.c.status == 'Approved'))
+    for employee_id, leave_type, start_date, working_days in approved:
+        key = (employee_id, leave_type, leave_year_of(start_date))
+        used[key] = used.get(key, 0) + working_days
+    
+    conn.execute(delete(leave_balances))
+    if used:
+        now = datetime.utcnow()
+        conn.execute(insert(leave_balances), [
+            {'employee_id': employee_id, 'leave_type': leave_type, 'leave_year': leave_year,
+             'used_days': used_days, 'updated_at': now}
+            for (employee_id, leave_type, leave_year), used_days in used.items()
+        ])
+    return used
+
+
+# ============================================================================
+# MIGRATIONS (append only - never renumber or edit an applied migration)
+# ============================================================================
+
+@migration(1, 'Add leave_requests.day_type')
+def add_day_type(conn):
+    columns = [column['name'] for column in inspect(conn).get_columns('leave_requests')]
+    if 'day_type' not in columns:
+        conn.execute(text(
+            "ALTER TABLE leave_requests ADD COLUMN day_type VARCHAR(20) DEFAULT 'Full Day'"
+        ))
+
+
+@migration(2, 'Backfill leave balance ledger')
+def backfill_leave_balances(conn):
+    # Keyed by calendar year (migration 6 re-keys it by leave year)
+    used = rewrite_ledger(conn, lambda day: day.year)
+    print(f"   Wrote {len(used)} ledger entries")
+
+
+@migration(3, 'Performance indexes', transactional=False)
+def performance_indexes(conn):
+    create_indexes(conn, 'leave_requests', [
+        'ix_leave_requests_status_dates',
+        'ix_leave_requests_employee_type_status',
+        'ix_leave_requests_submitted_at_id',
+        'ix_leave_requests_status_submitted_at',
+    ])
+    create_indexes(conn, 'team_members', [
+        'ix_team_members_stream',
+        'ix_team_members_location',
+    ])
+    create_indexes(conn, 'holidays', [
+        'ix_holidays_location_date',
+    ])
+
+
+@migration(4, 'Add email_outbox.digest')
+def add_email_digest(conn):
+    columns = [column['name'] for column in inspect(conn).get_columns('email_outbox')]
+    if 'digest' not in columns:
+        conn.execute(text(
+            "ALTER TABLE email_outbox ADD COLUMN digest BOOLEAN DEFAULT FALSE"
+        ))
+
+
+@migration(5, 'Backfill leave_days availability table')
+def backfill_leave_days(conn):
+    approved = conn.execute(select(
+        leave_requests.c.id, leave_requests.c.employee_id, leave_requests.c.leave_type,
+        leave_requests.c.day_type, leave_requests.c.start_date, leave_requests.c.end_date
+    ).where(leave_requests.c.status == 'Approved'))
+    rows = [
+        {'date': start_date + timedelta(days=offset), 'employee_id': employee_id, 'leave_id': leave_id,
+         'leave_type': leave_type, 'day_type': day_type or 'Full Day'}
+        for leave_id, employee_id, leave_type, day_type, start_date, end_date in approved
+        for offset in range((end_date - start_date).days + 1)
+    ]
+    conn.execute(delete(leave_days))
+    if rows:
+        conn.execute(insert(leave_days), rows)
+    print(f"   Materialized {len(rows)} leave days")
+
+
+@migration(6, 'Leave years: re-key the ledger and snapshot finished years')
+def backfill_leave_years(conn):
+    settings = dict(conn.execute(select(configuration.c.key, configuration.c.value).where(
+        configuration.c.key.in_(['leave_year_start', 'carry_forward_Annual', 'carry_forward_Sick'])
+    )).all())
+    start_month, start_day = 1, 1
+    if (settings.get('leave_year_start') or '').strip():
+        start_month, start_day = (int(part) for part in settings['leave_year_start'].split('-'))
+    caps = {'Annual': float(settings.get('carry_forward_Annual') or 5),
+            'Sick': float(settings.get('carry_forward_Sick') or 0)}
     
-    db_path = 'leaves.db'
+    def leave_year_of(day):
+        return day.year if (day.month, day.day) >= (start_month, start_day) else day.year - 1
     
-    # Check if database exists
-    if not os.path.exists(db_path):
-        print("ℹ️  Database doesn't exist yet - will be created by init_db.py")
-        return
+    # The ledger was keyed by calendar year; re-key it for the configured year start
+    used = rewrite_ledger(conn, leave_year_of)
+    print(f"   Wrote {len(used)} ledger entries")
     
-    print("🔍 Checking database for migration needs...")
+    # Close every finished year in order so carry-forwards chain:
+    # closing = entitlement + carried in - used, carried forward = closing capped
+    # (nothing for members who joined after the year ended). The chain starts a
+    # year before the first recorded usage, as balances do for a year without
+    # a snapshot; that year itself is not snapshotted.
+    current_year = leave_year_of(date.today())
+    first_year = min((leave_year for _, _, leave_year in used), default=current_year)
+    members = conn.execute(select(
+        team_members.c.id, team_members.c.annual_entitlement,
+        team_members.c.sick_entitlement, team_members.c.created_at
+    )).all()
+    carried = {}
+    for leave_year in range(first_year - 1, current_year):
+        last_day = date(leave_year + 1, start_month, start_day) - timedelta(days=1)
+        rows = []
+        for member_id, annual_entitlement, sick_entitlement, created_at in members:
+            for leave_type, entitlement in (('Annual', annual_entitlement), ('Sick', sick_entitlement)):
+                carried_in = carried.get((member_id, leave_type), 0)
+                used_days = used.get((member_id, leave_type, leave_year), 0)
+                closing = entitlement + carried_in - used_days
+                carried_forward = max(0, min(closing, caps[leave_type]))
+                if created_at and created_at.date() > last_day:
+                    carried_forward = 0
+                carried[(member_id, leave_type)] = carried_forward
+                rows.append({'employee_id': member_id, 'leave_type': leave_type, 'leave_year': leave_year,
+                             'entitlement': entitlement, 'carried_in': carried_in, 'used_days': used_days,
+                             'closing_balance': closing, 'carried_forward': carried_forward,
+                             'created_at': datetime.utcnow()})
+        if leave_year < first_year:
+            continue
+        conn.execute(delete(leave_year_snapshots).where(leave_year_snapshots.c.leave_year == leave_year))
+        if rows:
+            conn.execute(insert(leave_year_snapshots), rows)
+        print(f"   Leave year {leave_year}: {len(rows)} snapshots")
+
+
+@migration(7, 'Add team_members.feed_secret')
+def add_feed_secret(conn):
+    columns = [column['name'] for column in inspect(conn).get_columns('team_members')]
+    if 'feed_secret' not in columns:
+        conn.execute(text("ALTER TABLE team_members ADD COLUMN feed_secret VARCHAR(32)"))
     
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    # Every member gets their own secret; links issued before this stop working
+    member_ids = [row[0] for row in conn.execute(text("SELECT id FROM team_members WHERE feed_secret IS NULL"))]
+    for member_id in member_ids:
+        conn.execute(text("UPDATE team_members SET feed_secret = :secret WHERE id = :id"),
+                     {'secret': secrets.token_urlsafe(12), 'id': member_id})
+    print(f"   Generated feed secrets for {len(member_ids)} members")
+
+
+@migration(8, 'Unique holidays per date and location')
+def unique_holidays(conn):
+    # Keep the oldest row of each (date, location); the calendar only ever showed one
+    deleted = conn.execute(text(
+        "DELETE FROM holidays WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM holidays GROUP BY date, location) AS keep)"
+    )).rowcount
+    print(f"   Removed {deleted} duplicate holidays")
     
-    try:
-        # Check current columns in leave_requests table
-        cursor.execute("PRAGMA table_info(leave_requests)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        print(f"   Current columns: {', '.join(columns)}")
-        
-        if 'day_type' not in columns:
-            print("➕ Adding day_type column...")
-            cursor.execute("""
-                ALTER TABLE leave_requests 
-                ADD COLUMN day_type VARCHAR(20) DEFAULT 'Full Day'
-            """)
-            conn.commit()
-            print("✅ day_type column added successfully!")
-        else:
-            print("✅ day_type column already exists - no migration needed")
-            
-    except Exception as e:
-        print(f"❌ Migration error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    inspector = inspect(conn)
+    unique_columns = [constraint['column_names'] for constraint in inspector.get_unique_constraints('holidays')]
+    unique_columns += [index['column_names'] for index in inspector.get_indexes('holidays') if index['unique']]
+    if ['date', 'location'] not in unique_columns:
+        print("   ➕ uq_holiday_date_location")
+        conn.execute(text("CREATE UNIQUE INDEX uq_holiday_date_location ON holidays (date, location)"))
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def applied_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    return set(row[0] for row in conn.execute(text("SELECT version FROM schema_migrations")))
+
+
+def record_version(conn, version, name):
+    conn.execute(text(
+        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"
+    ), {'version': version, 'name': name, 'applied_at': datetime.utcnow()})
+
+
+def migrate():
+    """Apply all pending migrations in version order"""
+
+    with app.app_context():
+        print(f"🔍 Checking {db.engine.dialect.name} database for migration needs...")
+        db.create_all()
+
+        with db.engine.begin() as conn:
+            add_model_columns(conn)
+            applied = applied_versions(conn)
+
+        pending = sorted(m for m in MIGRATIONS if m[0] not in applied)
+        if not pending:
+            print("✅ Database is up to date - no migration needed")
+            return
+
+        for version, name, transactional, fn in pending:
+            print(f"➕ Migration {version}: {name}")
+            try:
+                if transactional:
+                    with db.engine.begin() as conn:
+                        fn(conn)
+                        record_version(conn, version, name)
+                else:
+                    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                        fn(conn)
+                        record_version(conn, version, name)
+            except Exception as e:
+                print(f"❌ Migration {version} failed: {e}")
+                raise
+            print(f"✅ Migration {version} applied")
+
 
 if __name__ == '__main__':
     migrate()
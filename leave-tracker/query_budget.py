@@ -0,0 +1,157 @@
+"""
+SQL Query Budget Check
+Seeds an in-memory database, requests every route as a Scrum Master and
+fails when a route issues more SQL statements than its declared budget.
+Each route is measured cold (per-process caches dropped), so the queries of
+cache builders count too. The check runs on a small and a larger team and
+also fails when a route's count grows with the number of rows, so N+1
+regressions are caught.
+
+Usage: python query_budget.py [members] [leaves_per_member]   (the larger team)
+"""
+
+import random
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import (create_app, db, TeamMember, Holiday, LeaveRequest, rebuild_balance_ledger, rebuild_leave_days,
+                 _data_versions, _change_listeners)
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+
+SMALL_TEAM = (10, 3)  # (members, leaves per member) compared against the larger team
+
+STREAMS = ['CRM', 'EIP', 'Website', 'Mobile', 'QA', 'Sitecore', 'Devops', 'BA']
+LOCATIONS = ['UAE', 'India']
+
+# (method, url, json body, maximum SQL statements per request with cold caches)
+QUERY_BUDGETS = [
+    ('GET', '/dashboard', None, 8),
+    ('GET', '/calendar', None, 3),
+    ('GET', '/leave/request', None, 5),
+    ('GET', '/leave/my-leaves', None, 3),
+    ('GET', '/leave/team-leaves', None, 3),
+    ('GET', '/leave/team-leaves?stream=CRM&status=Approved&from=2025-06-01', None, 3),
+    ('GET', '/api/team-leaves', None, 2),
+    ('GET', '/admin', None, 5),
+    ('GET', '/admin/team', None, 5),
+    ('GET', '/admin/holidays', None, 3),
+    ('GET', '/admin/sprint-capacity', None, 3),
+    ('GET', '/api/calendar/events', None, 3),
+    ('GET', '/api/calendar/events?start=2026-03-01T00:00:00%2B04:00&end=2026-04-12T00:00:00%2B04:00'
+            '&stream=CRM&location=India', None, 3),
+    ('GET', '/api/coverage?start=2026-01-01&end=2026-03-31', None, 6),
+    ('GET', '/api/availability?start=2026-03-01&end=2026-03-31&stream=CRM', None, 2),
+    ('POST', '/api/calculate-working-days',
+     {'start_date': '2026-03-01', 'end_date': '2026-03-31', 'location': 'India'}, 3),
+    ('POST', '/api/calculate-working-days/batch',
+     {'ranges': [{'start_date': '2025-12-01', 'end_date': '2026-02-28', 'location': loc}
+                 for loc in LOCATIONS]}, 6),
+    ('POST', '/api/check-overlap',
+     {'employee_id': 3, 'start_date': '2026-03-01', 'end_date': '2026-03-31'}, 3),
+]
+
+
+def seed(members=40, leaves_per_member=10):
+    """Create a synthetic team with holidays and leave history"""
+    rng = random.Random(42)
+    db.create_all()
+
+    team = [TeamMember(name='Scrum Master', email='sm@example.com', stream='Scrum',
+                       location='UAE', role='scrum_master')]
+    for i in range(members):
+        team.append(TeamMember(name=f'Member {i}', email=f'member{i}@example.com',
+                               stream=STREAMS[i % len(STREAMS)],
+                               location=LOCATIONS[i % len(LOCATIONS)]))
+    db.session.add_all(team)
+
+    for year in (2025, 2026):
+        for i in range(12):
+            db.session.add(Holiday(name=f'Holiday {year}-{i}', date=date(year, i + 1, 10),
+                                   location=['UAE', 'India', 'Both'][i % 3]))
+    db.session.flush()
+
+    for member in team:
+        for _ in range(leaves_per_member):
+            start = date(2025, 1, 1) + timedelta(days=rng.randint(0, 700))
+            end = start + timedelta(days=rng.randint(0, 6))
+            db.session.add(LeaveRequest(
+                employee_id=member.id, leave_type=rng.choice(['Annual', 'Sick']),
+                start_date=start, end_date=end, working_days=(end - start).days + 1,
+                status=rng.choice(['Pending', 'Approved', 'Rejected']), reason='Synthetic'
+            ))
+    db.session.commit()
+    rebuild_balance_ledger()
+    rebuild_leave_days()
+    return team[0].id
+
+
+def reset_caches():
+    """Drop every in-process cache, as after a bulk write to all tables"""
+    tables = set(_data_versions)
+    for table in tables:
+        _data_versions[table] += 1
+    for listener in _change_listeners:
+        listener(tables, None)
+    db.session.expunge_all()
+
+
+def measure(client, method, url, body):
+    """Request a route and return (status_code, statements issued)"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.open(url, method=method, json=body)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return response.status_code, len(statements)
+
+
+def count_queries(members, leaves_per_member):
+    """Seed a fresh database and return [(status_code, statements)] per QUERY_BUDGETS entry, measured cold"""
+    with app.app_context():
+        db.drop_all()
+        user_id = seed(members, leaves_per_member)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['user_role'] = 'scrum_master'
+
+        counts = []
+        for method, url, body, _ in QUERY_BUDGETS:
+            reset_caches()
+            counts.append(measure(client, method, url, body))
+        return counts
+
+
+def run(members=40, leaves_per_member=10):
+    """Check every route against its budget on a small and a larger team; returns the number of failures"""
+    small = count_queries(*SMALL_TEAM)
+    large = count_queries(members, leaves_per_member)
+
+    failures = 0
+    print(f"Query budgets ({SMALL_TEAM[0]} / {members} members, "
+          f"{SMALL_TEAM[1]} / {leaves_per_member} leaves each):")
+    for (method, url, body, budget), (small_status, small_count), (status, count) in zip(QUERY_BUDGETS, small, large):
+        ok = max(small_status, status) < 400 and small_count <= budget and count <= budget and count <= small_count
+        failures += not ok
+        print(f"  {'✓' if ok else '✗'} {method:4} {url:60} {small_count:3} / {count:3} / {budget} queries "
+              f"(HTTP {status})")
+
+    return failures
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    failed = run(*args)
+    if failed:
+        print(f"❌ {failed} route(s) over budget")
+    else:
+        print("✅ All routes within budget")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,42 @@
+"""
+Leave Balance Ledger Rebuild
+Recomputes the leave_balances ledger from approved leave history and reports drift
+(and re-materializes the leave_days availability table).
+Run with --check to report drift without changing anything
+"""
+
+import sys
+
+from app import app, db, rebuild_balance_ledger, rebuild_leave_days
+
+
+def rebuild(fix=True):
+    """Rebuild the ledger and print every entry that drifted"""
+
+    with app.app_context():
+        db.create_all()
+
+        print("🔍 Comparing balance ledger with approved leave history...")
+        drift = rebuild_balance_ledger(fix=fix)
+        if fix:
+            print(f"🔁 Rebuilt availability table ({rebuild_leave_days()} leave days)")
+
+        if not drift:
+            print("✅ Ledger matches history - no drift")
+            return 0
+
+        for employee_id, leave_type, leave_year, ledger_days, actual_days in drift:
+            print(f"  ⚠️  Member {employee_id} {leave_type} {leave_year}: "
+                  f"ledger {ledger_days} days, history {actual_days} days")
+
+        if fix:
+            print(f"✅ Corrected {len(drift)} ledger entries")
+        else:
+            print(f"❌ {len(drift)} ledger entries drifted (run without --check to fix)")
+        return len(drift)
+
+
+if __name__ == '__main__':
+    check_only = '--check' in sys.argv
+    drifted = rebuild(fix=not check_only)
+    sys.exit(1 if check_only and drifted else 0)
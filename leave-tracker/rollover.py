@@ -0,0 +1,58 @@
+"""
+Leave Year Rollover
+Snapshots every member's closing balances for a finished leave year, so the
+next year's balances start from the (capped) carry-forward instead of summing
+all history. Safe to re-run: snapshots are recomputed, e.g. after late approvals.
+
+Usage:
+    python rollover.py                 # the leave year that ended most recently
+    python rollover.py --year 2026     # a specific leave year
+    python rollover.py --dry-run       # show the snapshots without saving them
+"""
+
+import argparse
+import sys
+from datetime import date
+
+from app import app, db, TeamMember, get_leave_year, get_leave_year_bounds, rollover_leave_year
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot closing leave balances for a leave year')
+    parser.add_argument('--year', type=int, help='leave year to close (default: the previous one)')
+    parser.add_argument('--force', action='store_true', help='allow closing a leave year that has not ended')
+    parser.add_argument('--dry-run', action='store_true', help='show the snapshots without saving them')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        current_year = get_leave_year(date.today())
+        leave_year = args.year if args.year is not None else current_year - 1
+        first_day, last_day = get_leave_year_bounds(leave_year)
+        if leave_year >= current_year and not args.force:
+            print(f"❌ Leave year {leave_year} ({first_day} to {last_day}) hasn't ended (use --force)")
+            return 1
+
+        print(f"🔁 Closing leave year {leave_year} ({first_day} to {last_day})")
+        snapshots = rollover_leave_year(leave_year)
+        if not snapshots:
+            # Most likely DATABASE_URL isn't set and this is an empty local database
+            print(f"❌ No team members in {db.engine.url.render_as_string(hide_password=True)}")
+            return 1
+        names = dict(db.session.query(TeamMember.id, TeamMember.name))
+        for snapshot in snapshots:
+            print(f"  {names[snapshot.employee_id]:30} {snapshot.leave_type:6} "
+                  f"{snapshot.entitlement:g} + {snapshot.carried_in:g} - {snapshot.used_days:g} "
+                  f"= {snapshot.closing_balance:g} → carry {snapshot.carried_forward:g}")
+
+        if args.dry_run:
+            db.session.rollback()
+            print(f"🔍 Dry run: {len(snapshots)} snapshots")
+        else:
+            db.session.commit()
+            print(f"✅ Saved {len(snapshots)} snapshots")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+// Bulk import of team members / holidays (Team Management and Holiday Management pages)
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function renderChanges(label, items, badge) {
+    if (!items || items.length === 0) {
+        return '';
+    }
+    const shown = items.slice(0, 50).map(item => `<li>${escapeHtml(item)}</li>`).join('');
+    const more = items.length > 50 ? `<li class="text-muted">... and ${items.length - 50} more</li>` : '';
+    return `<p class="mb-1"><span class="badge bg-${badge}">${items.length}</span> ${label}</p>
+            <ul class="small">${shown}${more}</ul>`;
+}
+
+function importFile(formId, resultId, url, dryRun) {
+    const form = document.getElementById(formId);
+    const result = document.getElementById(resultId);
+    if (!form.reportValidity()) {
+        return;
+    }
+
+    const data = new FormData(form);
+    data.set('dry_run', dryRun ? '1' : '0');
+    result.innerHTML = '<p class="text-muted"><i class="fas fa-spinner fa-spin"></i> Processing...</p>';
+
+    fetch(url, { method: 'POST', body: data })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            result.innerHTML = `<div class="alert alert-danger">${escapeHtml(data.error)}</div>`;
+            return;
+        }
+        const changes = renderChanges('to add', data.inserted, 'success')
+            + renderChanges('to update', data.updated, 'primary')
+            + renderChanges('to deactivate', data.deactivated, 'warning')
+            + renderChanges('to delete', data.deleted, 'danger');
+        const heading = data.dry_run
+            ? `Preview of ${data.rows} rows - nothing saved yet`
+            : `Imported ${data.rows} rows`;
+        result.innerHTML = `<div class="alert alert-${data.dry_run ? 'info' : 'success'}">${heading}
+                                (${data.unchanged} unchanged)</div>${changes}`;
+        if (!data.dry_run) {
+            setTimeout(() => location.reload(), 1500);
+        }
+    })
+    .catch(() => {
+        result.innerHTML = '<div class="alert alert-danger">Import failed - please try again</div>';
+    });
+}